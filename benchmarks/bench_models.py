@@ -0,0 +1,257 @@
+# coding: utf-8
+"""Benchmarks for the model loading and serialization hot paths.
+
+Seeds a temporary SQLite file at a given scale factor and times the paths
+production runs: the product listing (full instances and card projections),
+the user profile, chat history and ProductGlobal with its variants. Prints one JSON document with throughput,
+queries per operation and peak memory per scenario:
+
+    python benchmarks/bench_models.py --scale 1 --output bench.json
+    python benchmarks/bench_models.py --scale 1 --compare bench.json
+
+With --compare the run exits non-zero when a scenario's throughput drops
+or its query count grows beyond --tolerance relative to the saved report.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sqlalchemy  # noqa: E402
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from kiero_models import instrumentation, sqlite_schema  # noqa: E402
+from kiero_models.kiero_models import (  # noqa: E402
+    Address, Category, ChatRoom, Dimension, File, FileGlobal, HistoryCategoryUser, HistoryProductUser, Message,
+    Order, PaymentMethod, Product, ProductGlobal, ProductVariant, Role, Store, User, Variant)
+from kiero_models.projections import ProductCard  # noqa: E402
+from kiero_models.serializer import json_many  # noqa: E402
+
+NOW = datetime.datetime(2024, 1, 1)
+PAGE_SIZE = 50
+
+
+def seed(engine, scale, rnd):
+    users = int(200 * scale)
+    stores = max(1, int(20 * scale))
+    categories = max(2, int(40 * scale))
+    products = int(2000 * scale)
+    orders = int(4000 * scale)
+    rooms = int(100 * scale)
+    globals_ = int(500 * scale)
+    text = 'lorem ipsum dolor sit amet ' * 20
+
+    rows = {}
+    rows[Role] = [dict(role_id=1, name='customer', status=1), dict(role_id=2, name='seller', status=1)]
+    rows[PaymentMethod] = [dict(method_id=i, name='method %d' % i, status=1) for i in range(1, 5)]
+    rows[User] = [dict(user_id=i, role_id=1 if i % 10 else 2, email='user%d@example.com' % i, password='x' * 60,
+                       register_type='email', status=1, is_active=1, name='user %d' % i, created_since=NOW)
+                  for i in range(1, users + 1)]
+    sellers = [row['user_id'] for row in rows[User] if row['role_id'] == 2] or [1]
+    rows[Address] = [dict(address_id=i, user_id=rnd.randint(1, users), address='street %d' % i, status=1,
+                          city='city', department='dept', neighborhood='hood', names='name')
+                     for i in range(1, users * 2 + 1)]
+    rows[Store] = [dict(store_id=i, user_id=sellers[i % len(sellers)], name='store %d' % i, nit=str(i),
+                        phone='555', address='street', status=1, created_since=NOW) for i in range(1, stores + 1)]
+    rows[Category] = [dict(category_id=i, name='category %d' % i, fullname='category %d' % i, status=1, in_menu=1,
+                           parent_id=None if i <= 5 else rnd.randint(1, i - 1)) for i in range(1, categories + 1)]
+    rows[Product] = [dict(product_id=i, category_id=rnd.randint(1, categories), store_id=rnd.randint(1, stores),
+                          user_id=rnd.choice(sellers), title='product %d %s' % (i, text[:200]), description=text,
+                          information=text, features=text, price='%d.99' % rnd.randint(1, 500), discount=5,
+                          earnings_percentage=10, stock=rnd.randint(0, 100), status=1, created_since=NOW)
+                     for i in range(1, products + 1)]
+    rows[File] = [dict(file_id=i * 3 + j, product_id=i, url='https://cdn.example.com/%d/%d.jpg' % (i, j),
+                       main=int(j == 0), status=1) for i in range(1, products + 1) for j in range(3)]
+    rows[Order] = [dict(order_id=i, product_id=rnd.randint(1, products), user_id=rnd.randint(1, users),
+                        seller_id=rnd.choice(sellers), method_id=rnd.randint(1, 4), quantity=rnd.randint(1, 3),
+                        total=rnd.randint(10, 900), status=rnd.randint(1, 4), created_since=NOW)
+                   for i in range(1, orders + 1)]
+    rows[ChatRoom] = [dict(room_id=i, user_id=rnd.randint(1, users), store_id=rnd.randint(1, stores),
+                           seller_id=rnd.choice(sellers), status=1, created_since=NOW) for i in range(1, rooms + 1)]
+    rows[Message] = [dict(message_id=i * 40 + j, room_id=i, user_id=rnd.randint(1, users), content=text[:120],
+                          status=1, created_since=NOW + datetime.timedelta(minutes=j))
+                     for i in range(1, rooms + 1) for j in range(40)]
+    # one history row per (user, product) and (user, category)
+    viewed = sorted({(rnd.randint(1, users), rnd.randint(1, products)) for _ in range(users * 10)})
+    rows[HistoryProductUser] = [dict(history_product_user_id=i, user_id=user_id, product=product_id,
+                                     visitor_count=rnd.randint(1, 9))
+                                for i, (user_id, product_id) in enumerate(viewed, 1)]
+    browsed = sorted({(rnd.randint(1, users), rnd.randint(1, categories)) for _ in range(users * 5)})
+    rows[HistoryCategoryUser] = [dict(history_category_user_id=i, user_id=user_id, category=category_id,
+                                      product_feedback_id=i, product_id=rnd.randint(1, products),
+                                      visitor_count=rnd.randint(1, 9))
+                                 for i, (user_id, category_id) in enumerate(browsed, 1)]
+    rows[Dimension] = [dict(dimension_id=1, name='color', display_type='swatch'),
+                       dict(dimension_id=2, name='size', display_type='list')]
+    rows[Variant] = [dict(variant_id=i, dimension_id=1 + i % 2, value='value %d' % i) for i in range(1, 21)]
+    rows[ProductGlobal] = [dict(product_global_id=i, product_id=rnd.randint(1, products), product_asin='B%09d' % i,
+                                price='%d.50' % rnd.randint(1, 500), title='global %d' % i)
+                           for i in range(1, globals_ + 1)]
+    rows[ProductVariant] = [dict(product_variant_id=i * 4 + j, product_global_id=i, variant_id=rnd.randint(1, 20))
+                            for i in range(1, globals_ + 1) for j in range(4)]
+    rows[FileGlobal] = [dict(file_id=i * 2 + j, product_global_id=i, url='https://cdn.example.com/g/%d/%d.jpg' % (i, j),
+                             main=int(j == 0), status=1) for i in range(1, globals_ + 1) for j in range(2)]
+
+    with engine.begin() as conn:
+        for model, values in rows.items():
+            conn.execute(insert(model.__table__), values)
+    return {model.__tablename__: len(values) for model, values in rows.items()}
+
+
+def measure(engine, name, operation, repeat):
+    session = Session(engine)
+    operation(session)  # warm up the serializers and statement caches
+    session.close()
+
+    with instrumentation.record_queries(name) as stats:
+        started = time.perf_counter()
+        rows = 0
+        for _ in range(repeat):
+            session = Session(engine)
+            rows += operation(session)
+            session.close()
+        elapsed = time.perf_counter() - started
+
+    # memory is traced on a separate run, tracemalloc would skew the timings
+    tracemalloc.start()
+    session = Session(engine)
+    operation(session)
+    session.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'ops': repeat,
+        'rows': rows,
+        'seconds': elapsed,
+        'ops_per_second': repeat / elapsed,
+        'rows_per_second': rows / elapsed,
+        'queries_per_op': stats.count / float(repeat),
+        'query_p50_ms': stats.percentile(50) * 1000,
+        'query_p99_ms': stats.percentile(99) * 1000,
+        'peak_memory_kb_per_op': peak / 1024.0,
+    }
+
+
+def scenarios(rnd, counts):
+    users = counts['users']
+    rooms = counts['chat_room']
+    globals_ = counts['products_global']
+
+    def product_listing(session):
+        page = session.query(Product).order_by(Product.product_id).limit(PAGE_SIZE).all()
+        return len([product.json('images', 'category') for product in page])
+
+    def product_listing_batched(session):
+        query = session.query(Product).order_by(Product.product_id).limit(PAGE_SIZE)
+        return len(json_many(query, 'images', 'category'))
+
+    def product_cards(session):
+        cards = ProductCard.load(session, order_by=Product.product_id, limit=PAGE_SIZE)
+        return len([card.json() for card in cards])
+
+    def user_profile(session):
+        user = session.get(User, rnd.randint(1, users))
+        data = user.json('orders', 'addresses')
+        return 1 + len(data.get('orders', ())) + len(data.get('addresses', ()))
+
+    def chat_history(session):
+        messages = session.query(Message).filter(Message.room_id == rnd.randint(1, rooms)) \
+            .order_by(Message.created_since.desc()).limit(PAGE_SIZE).all()
+        return len([message.json() for message in messages])
+
+    def product_global_variants(session):
+        start = rnd.randint(1, max(1, globals_ - 20))
+        items = session.query(ProductGlobal).filter(ProductGlobal.product_global_id.between(start, start + 19)).all()
+        return len([item.json('product_variants', 'variant', 'dimension', 'images') for item in items])
+
+    return [
+        ('product_listing', product_listing),
+        ('product_listing_batched', product_listing_batched),
+        ('product_cards', product_cards),
+        ('user_profile', user_profile),
+        ('chat_history', chat_history),
+        ('product_global_variants', product_global_variants),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help='data volume multiplier')
+    parser.add_argument('--repeat', type=int, default=50, help='operations per scenario')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--only', action='append', help='run only the named scenario(s)')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='previous JSON report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown (default 0.2)')
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        engine = create_engine('sqlite:///' + path)
+        sqlite_schema.create_all(engine)
+        started = time.perf_counter()
+        counts = seed(engine, args.scale, rnd)
+        seed_seconds = time.perf_counter() - started
+        instrumentation.install(engine)
+
+        results = {}
+        for name, operation in scenarios(rnd, counts):
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(engine, name, operation, args.repeat)
+        engine.dispose()
+    finally:
+        os.remove(path)
+
+    report = {
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'seed_seconds': seed_seconds,
+        'rows': counts,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(json.load(fh), report, args.tolerance)
+        for line in regressions:
+            sys.stderr.write(line + '\n')
+        if regressions:
+            sys.exit(1)
+    return report
+
+
+def compare(baseline, current, tolerance):
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        if result['ops_per_second'] < before['ops_per_second'] * (1 - tolerance):
+            regressions.append('%s: %.1f ops/s, was %.1f' % (name, result['ops_per_second'], before['ops_per_second']))
+        if result['queries_per_op'] > before['queries_per_op'] * (1 + tolerance):
+            regressions.append('%s: %.1f queries/op, was %.1f' % (name, result['queries_per_op'], before['queries_per_op']))
+    return regressions
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+# coding: utf-8
+"""Per-product and per-store counters in product_stats and store_stats.
+
+product_stats holds, per product, the rating sum and count (rating_products),
+the purchase rating sum and count (rate_purchase.rate_product of its
+orders), the number of orders and units sold (every orders row, whatever its
+status) and the questions without an answer. store_stats holds the same
+counters summed over the store's products.
+
+Once installed, the tracker keeps both tables current inside each flush:
+inserted ratings, orders and questions are applied as deltas, any other
+change to a counted row recomputes only the products it touches.
+
+    tracker = AggregateTracker()
+    tracker.install()
+    product.stats.rating_average, product.stats.units_sold
+
+Writes made outside the ORM are not seen; rebuild() recomputes from the
+source tables and reconcile() reports (and optionally fixes) drift:
+
+    python -m kiero_models.aggregates DATABASE_URL rebuild [--legacy]
+    python -m kiero_models.aggregates DATABASE_URL check
+"""
+import datetime
+import sys
+
+from sqlalchemy import create_engine, delete, event, exists, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .catalog import Answer, Product, ProductDetails, ProductStats, Question, RatingProduct, StoreStats
+from .orders import Order, RatePurchase
+from .upsert import connection_for, upsert
+
+COUNTERS = ('rating_sum', 'rating_count', 'purchase_rating_sum', 'purchase_rating_count', 'order_count',
+            'units_sold', 'questions_open')
+# columns whose change affects the counters, per tracked model
+TRACKED = {
+    RatingProduct: ('product_id', 'value'),
+    Order: ('product_id', 'quantity'),
+    RatePurchase: ('order_id', 'rate_product'),
+    Question: ('product_id',),
+    Answer: ('question_id',),
+    Product: ('store_id',),
+}
+IN_CHUNK_SIZE = 500
+
+
+class AggregateTracker(object):
+    def __init__(self):
+        self.deltas = 0
+        self.recomputed = 0
+
+    def install(self):
+        event.listen(Session, 'after_flush', self._after_flush)
+
+    def uninstall(self):
+        event.remove(Session, 'after_flush', self._after_flush)
+
+    def stats(self):
+        return {'deltas': self.deltas, 'recomputed': self.recomputed}
+
+    def _after_flush(self, session, context):
+        changes = _Changes()
+        for obj in session.new:
+            if type(obj) in TRACKED:
+                changes.added(obj)
+        for obj in session.dirty:
+            if type(obj) in TRACKED:
+                changes.modified(obj)
+        for obj in session.deleted:
+            if type(obj) in TRACKED:
+                changes.removed(obj)
+        if changes:
+            self.deltas, self.recomputed = changes.apply(session.connection(), self.deltas, self.recomputed)
+
+
+class _Changes(object):
+    def __init__(self):
+        self.deltas = {}             # product_id -> {counter: delta}
+        self.recompute = set()       # product ids
+        self.stores = set()          # store ids to recompute whatever happens to their products
+        self.deleted_products = set()
+        self.orders = {}             # order_id -> pending delta, product unknown yet
+        self.questions = set()       # question ids whose product must be recomputed
+
+    def __bool__(self):
+        return bool(self.deltas or self.recompute or self.stores or self.deleted_products or self.orders
+                    or self.questions)
+
+    def add_delta(self, product_id, **counters):
+        if product_id is None:
+            return
+        delta = self.deltas.setdefault(product_id, {})
+        for name, value in counters.items():
+            delta[name] = delta.get(name, 0) + (value or 0)
+
+    def added(self, obj):
+        model = type(obj)
+        values = inspect(obj).dict
+        if model is RatingProduct:
+            self.add_delta(values.get('product_id'), rating_sum=values.get('value'), rating_count=1)
+        elif model is Order:
+            if values.get('quantity') is None:
+                # filled by a server default we have not read back
+                self.recompute.add(values.get('product_id'))
+            else:
+                self.add_delta(values.get('product_id'), order_count=1, units_sold=values['quantity'])
+        elif model is RatePurchase:
+            if values.get('rate_product') is not None:
+                delta = self.orders.setdefault(values.get('order_id'), {})
+                delta['purchase_rating_sum'] = delta.get('purchase_rating_sum', 0) + values['rate_product']
+                delta['purchase_rating_count'] = delta.get('purchase_rating_count', 0) + 1
+        elif model is Question:
+            self.add_delta(values.get('product_id'), questions_open=1)
+        elif model is Answer:
+            self.questions.add(values.get('question_id'))
+
+    def modified(self, obj):
+        state = inspect(obj)
+        names = TRACKED[type(obj)]
+        if not any(state.attrs[name].history.has_changes() for name in names):
+            return
+        self.touch(obj, state, names)
+
+    def removed(self, obj):
+        state = inspect(obj)
+        if type(obj) is Product:
+            self.deleted_products.add(state.identity[0])
+            self.stores.update(_values(state, 'store_id'))
+            return
+        self.touch(obj, state, TRACKED[type(obj)])
+
+    def touch(self, obj, state, names):
+        model = type(obj)
+        if model is Product:
+            self.recompute.add(state.identity[0])
+            self.stores.update(_values(state, 'store_id'))
+        elif model is RatePurchase:
+            for order_id in _values(state, 'order_id'):
+                self.orders[order_id] = None
+        elif model is Answer:
+            self.questions.update(_values(state, 'question_id'))
+        else:
+            self.recompute.update(_values(state, 'product_id'))
+
+    def apply(self, conn, deltas, recomputed):
+        self._resolve(conn)
+        self.recompute.discard(None)
+        self.recompute -= self.deleted_products
+        for product_id in self.deleted_products:
+            self.deltas.pop(product_id, None)
+        if self.deleted_products:
+            for chunk in _chunks(self.deleted_products):
+                conn.execute(delete(ProductStats.__table__).where(ProductStats.product_id.in_(chunk)))
+
+        store_deltas = {}
+        pending = [(product_id, delta) for product_id, delta in self.deltas.items()
+                   if product_id not in self.recompute and any(delta.values())]
+        stores_of = _stores_of(conn, [product_id for product_id, _ in pending])
+        for product_id, delta in pending:
+            if _add(conn, ProductStats, ProductStats.product_id, product_id, delta):
+                deltas += 1
+                store_id = stores_of.get(product_id)
+                if store_id is not None:
+                    totals = store_deltas.setdefault(store_id, {})
+                    for name, value in delta.items():
+                        totals[name] = totals.get(name, 0) + value
+            else:
+                self.recompute.add(product_id)
+
+        if self.recompute:
+            self.stores.update(store_id for store_id in _stores_of(conn, self.recompute).values())
+            rebuild_products(conn, self.recompute)
+            self.stores.update(store_id for store_id in _stores_of(conn, self.recompute).values())
+            recomputed += len(self.recompute)
+
+        for store_id, delta in store_deltas.items():
+            if store_id not in self.stores and not _add(conn, StoreStats, StoreStats.store_id, store_id, delta):
+                self.stores.add(store_id)
+        self.stores.discard(None)
+        if self.stores:
+            rebuild_stores(conn, self.stores)
+        return deltas, recomputed
+
+    def _resolve(self, conn):
+        """Map the collected order and question ids to their products."""
+        if self.orders:
+            products = {}
+            for chunk in _chunks(list(self.orders)):
+                products.update(conn.execute(select(Order.order_id, Order.product_id)
+                                             .where(Order.order_id.in_(chunk))).all())
+            for order_id, delta in self.orders.items():
+                if delta is None:
+                    self.recompute.add(products.get(order_id))
+                else:
+                    self.add_delta(products.get(order_id), **delta)
+        if self.questions:
+            for chunk in _chunks([question_id for question_id in self.questions if question_id is not None]):
+                self.recompute.update(conn.execute(select(Question.product_id)
+                                                   .where(Question.question_id.in_(chunk))).scalars())
+
+
+def _values(state, name):
+    """Old and new values of a column attribute, without loading it."""
+    history = state.attrs[name].history
+    return {value for value in history.sum() if value is not None}
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        yield ids[start:start + IN_CHUNK_SIZE]
+
+
+def _stores_of(conn, product_ids):
+    found = {}
+    for chunk in _chunks(product_ids):
+        found.update(conn.execute(select(ProductStats.product_id, ProductStats.store_id)
+                                  .where(ProductStats.product_id.in_(chunk))).all())
+    return found
+
+
+def _add(conn, model, key_column, key, delta):
+    """Add `delta` to one counter row; False when the row does not exist yet."""
+    table = model.__table__
+    values = {name: table.c[name] + value for name, value in delta.items() if value}
+    values['updated_since'] = func.current_timestamp()
+    return conn.execute(update(table).where(key_column == key).values(values)).rowcount > 0
+
+
+def product_counters(product_ids=None):
+    """select() of product_id, store_id and the COUNTERS, computed from the source tables."""
+    def restrict(stmt, column):
+        return stmt.where(column.in_(product_ids)) if product_ids is not None else stmt
+
+    ratings = restrict(select(RatingProduct.product_id.label('product_id'),
+                              func.sum(RatingProduct.value).label('rating_sum'),
+                              func.count().label('rating_count'))
+                       .group_by(RatingProduct.product_id), RatingProduct.product_id).subquery()
+    purchases = restrict(select(Order.product_id.label('product_id'),
+                                func.sum(RatePurchase.rate_product).label('purchase_rating_sum'),
+                                func.count(RatePurchase.rate_product).label('purchase_rating_count'))
+                         .join(Order, Order.order_id == RatePurchase.order_id)
+                         .group_by(Order.product_id), Order.product_id).subquery()
+    orders = restrict(select(Order.product_id.label('product_id'),
+                             func.count().label('order_count'),
+                             func.sum(func.coalesce(Order.quantity, 0)).label('units_sold'))
+                      .group_by(Order.product_id), Order.product_id).subquery()
+    questions = restrict(select(Question.product_id.label('product_id'),
+                                func.count().label('questions_open'))
+                         .where(~exists().where(Answer.question_id == Question.question_id))
+                         .group_by(Question.product_id), Question.product_id).subquery()
+
+    products = Product.__table__
+    stmt = select(
+        products.c.product_id, products.c.store_id,
+        func.coalesce(ratings.c.rating_sum, 0), func.coalesce(ratings.c.rating_count, 0),
+        func.coalesce(purchases.c.purchase_rating_sum, 0), func.coalesce(purchases.c.purchase_rating_count, 0),
+        func.coalesce(orders.c.order_count, 0), func.coalesce(orders.c.units_sold, 0),
+        func.coalesce(questions.c.questions_open, 0),
+    ).select_from(
+        products
+        .outerjoin(ratings, ratings.c.product_id == products.c.product_id)
+        .outerjoin(purchases, purchases.c.product_id == products.c.product_id)
+        .outerjoin(orders, orders.c.product_id == products.c.product_id)
+        .outerjoin(questions, questions.c.product_id == products.c.product_id)
+    )
+    return restrict(stmt, products.c.product_id)
+
+
+def store_counters(store_ids=None):
+    stats = ProductStats.__table__
+    stmt = select(stats.c.store_id, *[func.sum(stats.c[name]) for name in COUNTERS]) \
+        .where(stats.c.store_id.isnot(None)) \
+        .group_by(stats.c.store_id)
+    return stmt.where(stats.c.store_id.in_(store_ids)) if store_ids is not None else stmt
+
+
+def rebuild_products(bind, product_ids=None):
+    """Recompute product_stats for `product_ids`, or for every product."""
+    conn = connection_for(bind)
+    table = ProductStats.__table__
+    columns = ['product_id', 'store_id'] + list(COUNTERS)
+    if product_ids is None:
+        conn.execute(delete(table))
+        source = product_counters().add_columns(func.current_timestamp())
+        conn.execute(insert(table).from_select(columns + ['updated_since'], source))
+        return
+    for chunk in _chunks(product_ids):
+        _replace(conn, table, columns, product_counters(chunk), chunk)
+
+
+def rebuild_stores(bind, store_ids=None):
+    """Recompute store_stats from product_stats for `store_ids`, or for every store."""
+    conn = connection_for(bind)
+    table = StoreStats.__table__
+    columns = ['store_id'] + list(COUNTERS)
+    if store_ids is None:
+        conn.execute(delete(table))
+        source = store_counters().add_columns(func.current_timestamp())
+        conn.execute(insert(table).from_select(columns + ['updated_since'], source))
+        return
+    for chunk in _chunks(store_ids):
+        _replace(conn, table, columns, store_counters(chunk), chunk)
+
+
+def _replace(conn, table, columns, source, keys):
+    """Upsert the rows of `source` and delete those of `keys` it no longer returns.
+
+    Upserting rather than DELETE + INSERT lets two transactions recompute
+    the same key at once (two first ratings of a product): the second
+    waits for the first's row instead of failing on the primary key.
+    """
+    key = columns[0]
+    now = datetime.datetime.utcnow()
+    rows = [dict(zip(columns, row), updated_since=now) for row in conn.execute(source)]
+    gone = set(keys) - set(row[key] for row in rows)
+    if gone:
+        conn.execute(delete(table).where(table.c[key].in_(sorted(gone))))
+    if rows:
+        upsert(conn, table, rows, (key,))
+
+
+def rebuild(bind):
+    rebuild_products(bind)
+    rebuild_stores(bind)
+
+
+def reconcile(bind, fix=False):
+    """Products whose stored counters differ from the source tables: [(product_id, {counter: (stored, actual)})].
+
+    With `fix` those products and their stores are recomputed.
+    """
+    conn = connection_for(bind)
+    table = ProductStats.__table__
+    stored = {row[0]: tuple(row[1:]) for row in
+              conn.execute(select(table.c.product_id, table.c.store_id, *[table.c[name] for name in COUNTERS]))}
+    drift = []
+    for row in conn.execute(product_counters()):
+        actual = tuple(row[1:])
+        current = stored.pop(row[0], None)
+        if current != actual:
+            names = ('store_id',) + COUNTERS
+            before = current if current is not None else (None,) * len(names)
+            drift.append((row[0], {name: (old, new) for name, old, new in zip(names, before, actual) if old != new}))
+    drift.extend((product_id, {'product_id': (product_id, None)}) for product_id in stored)
+    if fix and drift:
+        rebuild_products(conn, [product_id for product_id, _ in drift])
+        rebuild_stores(conn)
+    return drift
+
+
+def sync_legacy_counters(bind):
+    """Copy units_sold into products.sales_accountant and product_details.sold for older readers."""
+    conn = connection_for(bind)
+    for model, column in ((Product, 'sales_accountant'), (ProductDetails, 'sold')):
+        table = model.__table__
+        sold = select(ProductStats.units_sold).where(ProductStats.product_id == table.c.product_id) \
+            .scalar_subquery()
+        conn.execute(update(table).where(exists().where(ProductStats.product_id == table.c.product_id))
+                     .values({column: sold}))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[1] not in ('rebuild', 'check'):
+        sys.stderr.write('usage: python -m kiero_models.aggregates DATABASE_URL rebuild|check [--legacy]\n')
+        return 2
+    engine = create_engine(argv[0])
+    with engine.begin() as conn:
+        if argv[1] == 'rebuild':
+            rebuild(conn)
+            if '--legacy' in argv:
+                sync_legacy_counters(conn)
+            return 0
+        drift = reconcile(conn)
+    for product_id, columns in drift:
+        print('product %s %r' % (product_id, columns))
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+# coding: utf-8
+"""Use the models from asyncio through sqlalchemy.ext.asyncio, without Flask.
+
+    engine = create_async_engine('postgresql+asyncpg://user@host/kiero')
+    Session = async_session_factory(engine)
+    async with Session() as session:
+        room = await session.get(ChatRoom, room_id)
+        data = await room.async_json('messages')
+        inbox = await async_json_many(session, select(Notifications).filter_by(user_id=user_id))
+
+An implicit lazy load cannot run under AsyncSession; it fails deep inside
+the driver with MissingGreenlet. Sessions from async_session_factory() load
+relationships only when asked to (loader options, async_preload,
+async_json): any other relationship access raises InvalidRequestError
+naming the attribute, unless the target is already in the identity map.
+Sessions are created with expire_on_commit=False so attributes stay readable
+after commit without another round trip.
+"""
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_object_session, async_sessionmaker
+from sqlalchemy.orm import Session, raiseload
+
+from .serializer import json_many, preload, serialize
+
+
+class AsyncSafeSession(Session):
+    """Sync session behind AsyncSession; relationships not loaded explicitly raise instead of lazy loading."""
+
+
+@event.listens_for(AsyncSafeSession, 'do_orm_execute')
+def _raise_on_implicit_load(state):
+    if state.is_select and not state.is_column_load and not state.is_relationship_load:
+        # explicit options on the statement take precedence over the wildcard
+        state.statement = state.statement.options(raiseload('*', sql_only=True))
+
+
+def async_session_factory(bind, **kwargs):
+    kwargs.setdefault('expire_on_commit', False)
+    kwargs.setdefault('sync_session_class', AsyncSafeSession)
+    return async_sessionmaker(bind, class_=AsyncSession, **kwargs)
+
+
+async def async_preload(session, items, *args):
+    """Load the relationships named in `args` (as in json()) for `items`."""
+    items = list(items)
+    await session.run_sync(lambda sync_session: preload(items, *args))
+    return items
+
+
+async def async_json(obj, *args, session=None):
+    """obj.json(*args), awaiting the relationship loads it needs first."""
+    session = session if session is not None else async_object_session(obj)
+    if session is None:
+        return serialize(obj, *args)
+
+    def load_and_serialize(sync_session):
+        preload([obj], *args)
+        return serialize(obj, *args)
+
+    return await session.run_sync(load_and_serialize)
+
+
+async def async_json_many(session, items, *args):
+    """json_many() for a list of instances or a select() run on `session`."""
+    return await session.run_sync(lambda sync_session: json_many(items, *args, session=sync_session))
@@ -0,0 +1,266 @@
+# coding: utf-8
+"""Seller and store sales analytics over Order, with NumPy.
+
+load_orders() runs one projected query for a seller's (or a store's) orders
+and returns them as an OrderFrame of column arrays; every breakdown is then
+a np.unique/np.bincount over those arrays instead of a Python loop over
+Order instances. Money is kept as integer cents, so sums are exact.
+
+    frame = analytics.load_orders(session, seller_id=7, start=month_ago)
+    frame.totals()        # {'orders': 412, 'units': 530, 'revenue': Decimal('18230400.00')}
+    frame.by('day')       # [{'day': date(2026, 9, 18), 'orders': 9, 'units': 11, 'revenue': ...}, ...]
+
+    analytics.summary(session, seller_id=7, start=month_ago, keys=('status',))   # one GROUP BY in SQL
+
+summary() computes the breakdowns in SQL, one GROUP BY each, when that is
+cheaper: a single breakdown, or NumPy not installed. SalesCache keeps a
+frame per (seller, store, window) and refreshes it incrementally, reading
+only the orders created or updated since its watermark.
+"""
+import collections
+import datetime
+import threading
+import time
+from decimal import Decimal
+
+from sqlalchemy import BigInteger, Date, String, cast, func, select, type_coerce
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .catalog import Product
+from .orders import Order
+from .upsert import connection_for
+
+KEYS = ('day', 'week', 'status', 'purchase_status', 'method', 'product')
+FIELDS = ('order_id', 'product_id', 'method_id', 'quantity', 'cents', 'status', 'purchase_status', 'created',
+          'changed')
+_DTYPES = {'created': 'datetime64[us]', 'changed': 'datetime64[us]'}
+_KEY_FIELDS = {'status': 'status', 'purchase_status': 'purchase_status', 'method': 'method_id',
+               'product': 'product_id'}
+
+
+def _criteria(seller_id=None, store_id=None, start=None, end=None):
+    criteria = []
+    if seller_id is not None:
+        criteria.append(Order.seller_id == seller_id)
+    if store_id is not None:
+        criteria.append(Order.product_id.in_(select(Product.product_id).where(Product.store_id == store_id)))
+    if start is not None:
+        criteria.append(Order.created_since >= start)
+    if end is not None:
+        criteria.append(Order.created_since < end)
+    return criteria
+
+
+def _cents():
+    return cast(func.round(func.coalesce(Order.total, 0) * 100), BigInteger)
+
+
+def _revenue(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def load_orders(bind, seller_id=None, store_id=None, start=None, end=None, changed_since=None):
+    """OrderFrame of the orders created in [start, end); with `changed_since`, only those created or updated since."""
+    conn = connection_for(bind)
+    criteria = _criteria(seller_id, store_id, start, end)
+    created = Order.created_since
+    changed = func.coalesce(Order.updated_since, Order.created_since)
+    if changed_since is not None:
+        criteria.append(changed >= changed_since)
+    if conn.dialect.name == 'sqlite':
+        # NumPy parses SQLite's ISO timestamps far faster than datetime objects are built
+        created, changed = type_coerce(created, String), type_coerce(changed, String)
+    stmt = select(Order.order_id, Order.product_id, Order.method_id, func.coalesce(Order.quantity, 0), _cents(),
+                  Order.status, func.coalesce(Order.purchase_status, 0), created, changed) \
+        .where(*criteria)
+    rows = conn.execute(stmt).all()
+    return OrderFrame.from_rows(rows)
+
+
+class OrderFrame(object):
+    """Orders as one NumPy array per field of FIELDS."""
+
+    def __init__(self, columns):
+        if np is None:
+            raise ImportError('OrderFrame needs numpy (pip install kiero_data_models[analytics])')
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        values = list(zip(*rows)) if rows else [()] * len(FIELDS)
+        return cls(dict((name, np.array(column, dtype=_DTYPES.get(name, 'int64')))
+                        for name, column in zip(FIELDS, values)))
+
+    def __len__(self):
+        return len(self.columns['order_id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def select(self, mask):
+        return OrderFrame(dict((name, column[mask]) for name, column in self.columns.items()))
+
+    def merge(self, newer):
+        """This frame with the orders of `newer` added, replacing earlier versions of the same orders."""
+        keep = ~np.isin(self['order_id'], newer['order_id'])
+        return OrderFrame(dict((name, np.concatenate([column[keep], newer[name]]))
+                               for name, column in self.columns.items()))
+
+    def between(self, start=None, end=None):
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self['created'] >= np.datetime64(start, 'us')
+        if end is not None:
+            mask &= self['created'] < np.datetime64(end, 'us')
+        return self.select(mask)
+
+    def totals(self):
+        return {'orders': len(self), 'units': int(self['quantity'].sum()), 'revenue': _revenue(self['cents'].sum())}
+
+    def group_keys(self, key):
+        if key in _KEY_FIELDS:
+            return self[_KEY_FIELDS[key]]
+        days = self['created'].astype('datetime64[D]')
+        if key == 'day':
+            return days
+        if key == 'week':
+            # 1970-01-01 was a Thursday; weeks start on Monday as in date_trunc('week')
+            return days - (days.astype('int64') + 3) % 7
+        raise ValueError('unknown breakdown %r, expected one of %s' % (key, ', '.join(KEYS)))
+
+    def by(self, key):
+        """[{key: value, 'orders', 'units', 'revenue'}] per distinct value of `key`, in key order."""
+        keys = self.group_keys(key)
+        frame = self
+        if keys.dtype.kind == 'M':
+            valid = ~np.isnat(keys)
+            keys, frame = keys[valid], self.select(valid)
+        values, inverse = np.unique(keys, return_inverse=True)
+        orders = np.bincount(inverse, minlength=len(values))
+        units = np.bincount(inverse, weights=frame['quantity'], minlength=len(values))
+        cents = np.bincount(inverse, weights=frame['cents'], minlength=len(values))
+        return [{key: value, 'orders': int(count), 'units': int(unit), 'revenue': _revenue(cent)}
+                for value, count, unit, cent in zip(values.tolist(), orders, units, cents)]
+
+    def summary(self, keys=KEYS):
+        return {'totals': self.totals(), 'by': dict((key, self.by(key)) for key in keys)}
+
+
+def _sql_key(conn, key):
+    if key in _KEY_FIELDS:
+        return {'status': Order.status, 'purchase_status': func.coalesce(Order.purchase_status, 0),
+                'method': Order.method_id, 'product': Order.product_id}[key]
+    if key not in ('day', 'week'):
+        raise ValueError('unknown breakdown %r, expected one of %s' % (key, ', '.join(KEYS)))
+    if conn.dialect.name == 'postgresql':
+        return cast(func.date_trunc(key, Order.created_since), Date)
+    if key == 'day':
+        return func.date(Order.created_since, type_=Date)
+    return func.date(Order.created_since, 'weekday 0', '-6 days', type_=Date)
+
+
+def sql_breakdown(bind, key, seller_id=None, store_id=None, start=None, end=None):
+    """Same rows as OrderFrame.by(key), grouped by the database."""
+    conn = connection_for(bind)
+    group = _sql_key(conn, key).label(key)
+    criteria = _criteria(seller_id, store_id, start, end)
+    if key not in _KEY_FIELDS:
+        criteria.append(Order.created_since.isnot(None))
+    stmt = select(group, func.count(), func.sum(func.coalesce(Order.quantity, 0)), func.sum(_cents())) \
+        .where(*criteria).group_by(group).order_by(group)
+    return [{key: value, 'orders': orders, 'units': int(units or 0), 'revenue': _revenue(cents or 0)}
+            for value, orders, units, cents in conn.execute(stmt)]
+
+
+def sql_totals(bind, seller_id=None, store_id=None, start=None, end=None):
+    conn = connection_for(bind)
+    orders, units, cents = conn.execute(
+        select(func.count(), func.sum(func.coalesce(Order.quantity, 0)), func.sum(_cents()))
+        .where(*_criteria(seller_id, store_id, start, end))).one()
+    return {'orders': orders, 'units': int(units or 0), 'revenue': _revenue(cents or 0)}
+
+
+def summary(bind, seller_id=None, store_id=None, start=None, end=None, keys=KEYS, pushdown=None):
+    """Totals and the breakdowns in `keys`.
+
+    With pushdown None, aggregates in SQL for at most one breakdown (a
+    GROUP BY returns far fewer rows than the orders) or when NumPy is
+    missing, otherwise loads the orders once and aggregates with NumPy.
+    """
+    if pushdown is None:
+        pushdown = np is None or len(keys) <= 1
+    if not pushdown:
+        return load_orders(bind, seller_id, store_id, start, end).summary(keys)
+    return {'totals': sql_totals(bind, seller_id, store_id, start, end),
+            'by': dict((key, sql_breakdown(bind, key, seller_id, store_id, start, end)) for key in keys)}
+
+
+class SalesCache(object):
+    """OrderFrames per (seller_id, store_id, window), refreshed from a watermark.
+
+    `window` is a number of days back from now, or a (start, end) pair. A
+    refresh older than `ttl` seconds reads only the orders created or
+    updated since the newest change already loaded, merges them in and, for
+    rolling windows, drops the orders that fell out of the window. Order
+    updates through SQLAlchemy bump updated_since; deleted orders and writes
+    that bypass it show up at the next full reload, every `full_reload`
+    seconds.
+    """
+
+    def __init__(self, ttl=60.0, maxsize=256, full_reload=3600.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.full_reload = full_reload
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+        self.loads = 0
+
+    def get(self, bind, seller_id=None, store_id=None, window=30):
+        key = (seller_id, store_id, window)
+        start, end = self._bounds(window)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        now = time.monotonic()
+        if entry is not None and now - entry['refreshed'] < self.ttl:
+            self.hits += 1
+            return entry['frame'].between(start, end)
+        if entry is None or now - entry['loaded'] >= self.full_reload:
+            self.loads += 1
+            loaded = now
+            frame = load_orders(bind, seller_id, store_id, start, end)
+        else:
+            loaded = entry['loaded']
+            self.refreshes += 1
+            newer = load_orders(bind, seller_id, store_id, start, end, changed_since=entry['watermark'])
+            frame = entry['frame'].merge(newer).between(start, end)
+        changed = frame['changed'][~np.isnat(frame['changed'])]
+        watermark = changed.max().astype(datetime.datetime) if len(changed) else None
+        if watermark is None and entry is not None:
+            watermark = entry['watermark']
+        with self._lock:
+            self._entries[key] = {'frame': frame, 'watermark': watermark, 'refreshed': now, 'loaded': loaded}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return frame
+
+    def invalidate(self, seller_id=None, store_id=None):
+        """Forget the frames of a seller or store (all of them with no arguments)."""
+        with self._lock:
+            for key in list(self._entries):
+                if (seller_id is None or key[0] == seller_id) and (store_id is None or key[1] == store_id):
+                    del self._entries[key]
+
+    @staticmethod
+    def _bounds(window):
+        if isinstance(window, tuple):
+            return window
+        return datetime.datetime.utcnow() - datetime.timedelta(days=window), None
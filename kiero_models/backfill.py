@@ -0,0 +1,305 @@
+# coding: utf-8
+"""Parallel, resumable backfills over a model's primary key range.
+
+A job splits the key range of its model into fixed chunks (aligned on
+multiples of chunk_size, so a resumed run cuts the same chunks) and runs
+each chunk in its own transaction in a process pool, every worker with its
+own engine. Finished chunks are appended to a checkpoint file; a killed run
+started again with the same checkpoint skips them. The checkpoint records
+the job's arguments and refuses a run with different ones.
+
+    result = run(ProductUsd(exchange_rate=4000), 'postgresql://user@host/kiero', workers=8,
+                 checkpoint='product-usd.ckpt', max_rows_per_second=20000)
+
+    python -m kiero_models.backfill DATABASE_URL product-usd exchange_rate=4000 \\
+        --workers 8 --checkpoint product-usd.ckpt --max-rows-per-second 20000
+
+Throttling is global: the runner stops handing out chunks while the rows
+per second of the run are above max_rows_per_second, and `pause` makes each
+worker sleep after every chunk. Progress (chunks, rows, rows/s, ETA) is
+logged every `report_every` seconds.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from decimal import Decimal
+
+from sqlalchemy import bindparam, create_engine, event, exists, func, select, update
+
+from .catalog import Category, Product, ProductGlobal
+from .money import as_money, as_numeric
+from .repricing import reprice_statement
+from .upsert import assign_ids
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+
+class Backfill(object):
+    """A backfill job; subclasses set `name` and `model` and implement process().
+
+    Jobs are pickled into the workers, so keep their state to plain values.
+    """
+    name = None
+    model = None
+    chunk_size = CHUNK_SIZE
+
+    @property
+    def key(self):
+        return self.model.__table__.primary_key.columns.values()[0]
+
+    def key_range(self, conn):
+        return conn.execute(select(func.min(self.key), func.max(self.key))).one()
+
+    def chunks(self, conn):
+        low, high = self.key_range(conn)
+        if low is None:
+            return []
+        start = low // self.chunk_size * self.chunk_size
+        return [(lo, lo + self.chunk_size - 1) for lo in range(start, high + 1, self.chunk_size)]
+
+    def process(self, conn, low, high):
+        """Handle keys low..high (inclusive) on `conn`; return the number of rows changed."""
+        raise NotImplementedError
+
+
+class BackfillResult(object):
+    def __init__(self, total_chunks):
+        self.total_chunks = total_chunks
+        self.chunks = 0
+        self.skipped = 0
+        self.rows = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return '<BackfillResult %d/%d chunks (%d resumed) rows=%d %.0f rows/s>' % (
+            self.chunks + self.skipped, self.total_chunks, self.skipped, self.rows, self.rows_per_second)
+
+
+class Checkpoint(object):
+    """Append-only file of finished chunks, one 'low high rows' line each, after a JSON header."""
+
+    def __init__(self, path, job):
+        self.path = path
+        # the job's arguments too: resuming with another exchange_rate must not skip chunks done with the old one
+        self.header = {'job': job.name, 'chunk_size': job.chunk_size,
+                       'params': dict((name, str(value)) for name, value in sorted(vars(job).items())
+                                      if name != 'chunk_size')}
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as fh:
+                lines = fh.read().splitlines()
+            if lines and json.loads(lines[0]) != self.header:
+                raise ValueError('checkpoint %s belongs to %s, not %s' % (path, lines[0], self.header))
+            for line in lines[1:]:
+                parts = line.split()
+                if len(parts) == 3:
+                    self.done.add((int(parts[0]), int(parts[1])))
+        else:
+            with open(path, 'w') as fh:
+                fh.write(json.dumps(self.header, sort_keys=True) + '\n')
+
+    def add(self, low, high, rows):
+        with open(self.path, 'a') as fh:
+            fh.write('%d %d %d\n' % (low, high, rows))
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.done.add((low, high))
+
+
+def run(job, url, workers=None, checkpoint=None, max_rows_per_second=None, pause=0.0, report_every=10.0,
+        engine_options=None):
+    """Run `job` against the database at `url`; returns a BackfillResult."""
+    engine_options = engine_options or {}
+    engine = _create_engine(url, engine_options)
+    with engine.connect() as conn:
+        chunks = job.chunks(conn)
+    engine.dispose()
+
+    done = Checkpoint(checkpoint, job) if checkpoint else None
+    result = BackfillResult(len(chunks))
+    pending = [chunk for chunk in chunks if done is None or chunk not in done.done]
+    result.skipped = len(chunks) - len(pending)
+    workers = workers or os.cpu_count() or 1
+    logger.info('%s: %d chunks of %d keys, %d already done, %d workers',
+                job.name, len(chunks), job.chunk_size, result.skipped, workers)
+
+    started = time.perf_counter()
+    last_report = started
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(url, engine_options)) as pool:
+        running = set()
+        while pending or running:
+            while pending and len(running) < workers * 2:
+                elapsed = time.perf_counter() - started
+                if max_rows_per_second and elapsed and result.rows / elapsed > max_rows_per_second:
+                    break
+                low, high = pending.pop(0)
+                running.add(pool.submit(_run_chunk, job, low, high, pause))
+            if not running:
+                # throttled: wait until the run is back under max_rows_per_second
+                ahead = result.rows / float(max_rows_per_second) - (time.perf_counter() - started)
+                time.sleep(min(1.0, max(0.01, ahead)))
+                continue
+            finished, running = wait(running, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in finished:
+                low, high, rows = future.result()
+                result.chunks += 1
+                result.rows += rows
+                if done is not None:
+                    done.add(low, high, rows)
+            result.elapsed = time.perf_counter() - started
+            if result.elapsed and time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                _report(job, result)
+    result.elapsed = time.perf_counter() - started
+    logger.info('%s finished: %r', job.name, result)
+    return result
+
+
+def _report(job, result):
+    remaining = result.total_chunks - result.skipped - result.chunks
+    per_chunk = result.elapsed / result.chunks if result.chunks else 0.0
+    logger.info('%s: %d/%d chunks, %d rows, %.0f rows/s, about %.0f s left', job.name,
+                result.chunks + result.skipped, result.total_chunks, result.rows, result.rows_per_second,
+                remaining * per_chunk)
+
+
+def _create_engine(url, options):
+    engine = create_engine(url, **options)
+    if engine.dialect.name == 'sqlite':
+        # take the write lock when the transaction starts, so concurrent
+        # workers queue up instead of failing with "database is locked"
+        @event.listens_for(engine, 'connect')
+        def _no_implicit_begin(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, 'begin')
+        def _begin_immediate(conn):
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+    return engine
+
+
+_worker_engine = None
+
+
+def _init_worker(url, options):
+    global _worker_engine
+    _worker_engine = _create_engine(url, options)
+
+
+def _run_chunk(job, low, high, pause):
+    with _worker_engine.begin() as conn:
+        rows = job.process(conn, low, high)
+    if pause:
+        time.sleep(pause)
+    return low, high, rows or 0
+
+
+class ProductUsd(Backfill):
+    """products.usd = price / exchange_rate."""
+    name = 'product-usd'
+    model = Product
+
+    def __init__(self, exchange_rate):
+        self.exchange_rate = Decimal(str(exchange_rate))
+
+    def process(self, conn, low, high):
+        table = Product.__table__
+        usd = func.round(as_numeric(table.c.price) / self.exchange_rate, 2)
+        return conn.execute(update(table).where(table.c.product_id.between(low, high))
+                            .values(usd=as_money(usd))).rowcount
+
+
+class Reprice(Backfill):
+    """products.price from usd, exchange_rate, earnings_percentage and discount; see kiero_models.repricing."""
+    name = 'reprice'
+    model = Product
+
+    def __init__(self, exchange_rate, round_to=None, default_earnings=0):
+        self.exchange_rate = Decimal(str(exchange_rate))
+        self.round_to = Decimal(str(round_to)) if round_to is not None else None
+        self.default_earnings = Decimal(str(default_earnings))
+
+    def process(self, conn, low, high):
+        stmt = reprice_statement(self.exchange_rate, self.round_to, self.default_earnings)
+        return conn.execute(stmt.where(Product.__table__.c.product_id.between(low, high))).rowcount
+
+
+class CategoryFullname(Backfill):
+    """Trim categories.fullname and collapse repeated whitespace in it."""
+    name = 'category-fullname'
+    model = Category
+    _SPACES = re.compile(r'\s+')
+
+    def process(self, conn, low, high):
+        table = Category.__table__
+        changed = []
+        for category_id, fullname in conn.execute(select(table.c.category_id, table.c.fullname)
+                                                  .where(table.c.category_id.between(low, high))):
+            normalized = self._SPACES.sub(' ', fullname or '').strip()
+            if fullname is not None and normalized != fullname:
+                changed.append({'_id': category_id, 'fullname': normalized})
+        if changed:
+            conn.execute(update(table).where(table.c.category_id == bindparam('_id'))
+                         .values(fullname=bindparam('fullname')), changed)
+        return len(changed)
+
+
+class ProductsToGlobal(Backfill):
+    """Create a products_global row for every product that has none."""
+    name = 'products-to-global'
+    model = Product
+    columns = ('product_id', 'title', 'price', 'color', 'size', 'package_weight')
+
+    def process(self, conn, low, high):
+        products = Product.__table__
+        target = ProductGlobal.__table__
+        rows = [dict(row._mapping) for row in conn.execute(
+            select(*[products.c[name] for name in self.columns], products.c.asin.label('product_asin'))
+            .where(products.c.product_id.between(low, high))
+            .where(~exists().where(target.c.product_id == products.c.product_id)))]
+        if not rows:
+            return 0
+        if conn.dialect.name == 'sqlite':
+            assign_ids(conn, target.c.product_global_id, rows)
+        conn.execute(target.insert(), rows)
+        return len(rows)
+
+
+JOBS = {job.name: job for job in (ProductUsd, Reprice, CategoryFullname, ProductsToGlobal)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a backfill job over the models.')
+    parser.add_argument('url')
+    parser.add_argument('job', choices=sorted(JOBS))
+    parser.add_argument('params', nargs='*', help='job arguments as name=value')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunk-size', type=int)
+    parser.add_argument('--checkpoint')
+    parser.add_argument('--max-rows-per-second', type=float)
+    parser.add_argument('--pause', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    job = JOBS[args.job](**dict(param.split('=', 1) for param in args.params))
+    if args.chunk_size:
+        job.chunk_size = args.chunk_size
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    run(job, args.url, workers=args.workers, checkpoint=args.checkpoint,
+        max_rows_per_second=args.max_rows_per_second, pause=args.pause)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
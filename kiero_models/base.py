@@ -0,0 +1,21 @@
+# coding: utf-8
+"""Declarative base shared by every model group; no Flask involved."""
+from sqlalchemy.orm import declarative_base
+
+from .serializer import json_many, serialize
+
+Base = declarative_base()
+
+
+class DBUtils:
+    def json(self, *args):
+        return serialize(self, *args)
+
+    @classmethod
+    def json_many(cls, items, *args, **kwargs):
+        return json_many(items, *args, **kwargs)
+
+    async def async_json(self, *args):
+        """json(*args) for an instance of an AsyncSession, see kiero_models.aio."""
+        from .aio import async_json
+        return await async_json(self, *args)
@@ -0,0 +1,128 @@
+# coding: utf-8
+"""Bulk import of the products_global family (ProductGlobal, ProductVariant, FileGlobal).
+
+Products are upserted on the unique product_asin in multi-row statements and
+their children are written with executemany, instead of one ORM object (and
+several INSERT round trips) per product.
+"""
+import logging
+import time
+
+from sqlalchemy import delete
+
+from .catalog import FileGlobal, ProductGlobal, ProductVariant
+from .upsert import assign_ids, connection_for, upsert
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+# positional layout of tuple input
+PRODUCT_FIELDS = ('product_asin', 'product_id', 'title', 'price', 'color', 'size',
+                  'package_weight', 'url', 'active', 'is_variant', 'variants', 'files')
+
+
+class ImportResult(object):
+    def __init__(self):
+        self.ids = {}
+        self.products = 0
+        self.variants = 0
+        self.files = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows(self):
+        return self.products + self.variants + self.files
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return '<ImportResult products=%d variants=%d files=%d %.0f rows/s>' % (
+            self.products, self.variants, self.files, self.rows_per_second)
+
+
+def import_products_global(bind, products, fields=PRODUCT_FIELDS, chunk_size=CHUNK_SIZE, replace_children=True):
+    """Upsert ProductGlobal rows with their variants and files.
+
+    `products` is an iterable of dicts keyed by ProductGlobal column names, or
+    tuples laid out as `fields`. Each may carry 'variants' (variant ids or
+    ProductVariant dicts) and 'files' (urls or FileGlobal dicts; the first url
+    becomes the main image). With `replace_children` the existing variants
+    (files) of an upserted product are replaced when it carries 'variants'
+    ('files'); a product without the key, or with None, keeps them. `bind` is a Session or Connection and
+    the caller owns the transaction.
+
+    Returns an ImportResult whose `ids` maps product_asin to product_global_id.
+    """
+    conn = connection_for(bind)
+    result = ImportResult()
+    started = time.perf_counter()
+    chunk = []
+    for product in products:
+        chunk.append(dict(zip(fields, product)) if isinstance(product, (tuple, list)) else dict(product))
+        if len(chunk) >= chunk_size:
+            _import_chunk(conn, chunk, replace_children, result)
+            chunk = []
+            result.elapsed = time.perf_counter() - started
+            logger.info('imported %d products, %.0f rows/s', result.products, result.rows_per_second)
+    if chunk:
+        _import_chunk(conn, chunk, replace_children, result)
+    result.elapsed = time.perf_counter() - started
+    logger.info('import finished: %r', result)
+    return result
+
+
+def _import_chunk(conn, chunk, replace_children, result):
+    variants = {}
+    files = {}
+    rows = []
+    for product in chunk:
+        asin = product['product_asin']
+        # a product without the key (or with None) keeps its children; [] removes them
+        product_variants = product.pop('variants', None)
+        product_files = product.pop('files', None)
+        if product_variants is not None:
+            variants[asin] = product_variants
+        if product_files is not None:
+            files[asin] = product_files
+        rows.append(product)
+    # a repeated asin is one product, the last occurrence wins as in upsert()
+    rows = list(dict((row['product_asin'], row) for row in rows).values())
+
+    table = ProductGlobal.__table__
+    if conn.dialect.name == 'sqlite':
+        assign_ids(conn, table.c.product_global_id, rows)
+    ids = dict(upsert(conn, table, rows, ['product_asin'], returning=('product_asin', 'product_global_id')))
+    result.ids.update(ids)
+    result.products += len(rows)
+
+    if replace_children:
+        replaced = [ids[asin] for asin in variants if asin in ids]
+        if replaced:
+            conn.execute(delete(ProductVariant.__table__).where(ProductVariant.product_global_id.in_(replaced)))
+        replaced = [ids[asin] for asin in files if asin in ids]
+        if replaced:
+            conn.execute(delete(FileGlobal.__table__).where(FileGlobal.product_global_id.in_(replaced)))
+
+    variant_rows = []
+    file_rows = []
+    for asin, product_global_id in ids.items():
+        for variant in variants.get(asin, ()):
+            row = dict(variant) if isinstance(variant, dict) else {'variant_id': variant}
+            row['product_global_id'] = product_global_id
+            variant_rows.append(row)
+        for i, image in enumerate(files.get(asin, ())):
+            row = dict(image) if isinstance(image, dict) else {'url': image, 'main': int(i == 0), 'status': 1}
+            row['product_global_id'] = product_global_id
+            file_rows.append(row)
+
+    if conn.dialect.name == 'sqlite':
+        assign_ids(conn, ProductVariant.__table__.c.product_variant_id, variant_rows)
+        assign_ids(conn, FileGlobal.__table__.c.file_id, file_rows)
+    if variant_rows:
+        conn.execute(ProductVariant.__table__.insert(), variant_rows)
+    if file_rows:
+        conn.execute(FileGlobal.__table__.insert(), file_rows)
+    result.variants += len(variant_rows)
+    result.files += len(file_rows)
@@ -0,0 +1,486 @@
+# coding: utf-8
+"""Categories, stores, products, product globals and their variants."""
+import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, Numeric, SmallInteger, \
+    String, Text, Boolean, UniqueConstraint
+from sqlalchemy.schema import FetchedValue
+from sqlalchemy.orm import backref, relationship
+
+from .base import Base, DBUtils
+from .money import Money
+from .users import User
+
+
+class Category(Base, DBUtils):
+    __tablename__ = 'categories'
+
+    category_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    name = Column(String(100), nullable=False)
+    fullname = Column(Text, nullable=False)
+    banner = Column(String(200))
+    parent_path = Column(String(250))
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    in_menu = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+    parent_id = Column(ForeignKey('categories.category_id'), index=True)
+    """
+    parent = relationship('Category',
+                          foreign_keys=category_id,
+                          primaryjoin="Category.category_id == Category.parent_id",
+                          remote_side=[parent_id])
+    """
+    parent = relationship("Category", remote_side=parent_id, primaryjoin="Category.category_id == Category.parent_id")
+    users_preferred = relationship('User', secondary='cetegory_preferred')
+
+    users_history = relationship('User', secondary='history_category_user')
+
+
+class File(Base, DBUtils):
+    __tablename__ = 'files'
+
+    file_id = Column(BigInteger, primary_key=True, server_default=FetchedValue())
+    product_id = Column(ForeignKey('products.product_id'), nullable=False, index=True)
+    url = Column(String(200), nullable=False)
+    main = Column(SmallInteger, server_default=FetchedValue())
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime, onupdate=datetime.datetime.utcnow)
+
+    file_product = relationship('Product', primaryjoin='File.product_id == Product.product_id', backref='files')
+
+
+class Product(Base, DBUtils):
+    __tablename__ = 'products'
+
+    product_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    category_id = Column(ForeignKey('categories.category_id'), nullable=False, index=True)
+    user_id = Column(ForeignKey('users.user_id'), index=True)
+    store_id = Column(ForeignKey('store.store_id'), index=True)
+    color = Column(String(80))
+    title = Column(String(800), nullable=False)
+    imagescsv = Column(String(800))
+    description = Column(Text, nullable=False)
+    information = Column(Text)
+    asin = Column(String(20), unique=True)
+    sku = Column(String(20))
+    usd = Column(Money)
+    price = Column(Money, nullable=False)
+    discount = Column(Numeric(18, 2))
+    earnings_percentage = Column(Numeric(5, 2), server_default=FetchedValue())
+    stock = Column(Integer, nullable=False)
+    weight = Column(Numeric(18, 2))
+    height = Column(Numeric(18, 2))
+    length = Column(Numeric(18, 2))
+    width = Column(Numeric(18, 2))
+    size = Column(String(8))
+    type = Column(String(100))
+    product_group = Column(String(150))
+    genre = Column(String(150))
+    model = Column(String(200))
+    edition = Column(String(200))
+    platform = Column(String(200))
+    format = Column(String(200))
+    is_prime = Column(SmallInteger, server_default=FetchedValue())
+    is_adult_product = Column(SmallInteger, server_default=FetchedValue())
+    package_height = Column(Numeric(10, 2))
+    package_length = Column(Numeric(10, 2))
+    package_width = Column(Numeric(10, 2))
+    package_weight = Column(Numeric(10, 2))
+    package_quantity = Column(Numeric(10, 2))
+    features = Column(Text)
+    category_tree = Column(Text)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime, onupdate=datetime.datetime.utcnow)
+    brand = Column(String(200))
+
+    category = relationship('Category', primaryjoin='Product.category_id == Category.category_id', backref='products')
+    store = relationship('Store', primaryjoin='Product.store_id == Store.store_id', backref='products')
+    user = relationship('User', primaryjoin='Product.user_id == User.user_id', backref='products')
+    images = relationship('File', primaryjoin='Product.product_id == File.product_id', backref='files')
+
+
+    users_suggested = relationship('User', secondary='products_suggested')
+    users_favorite = relationship('User', secondary='products_favorite')
+
+    sales_accountant = Column(Integer)
+
+    users_history = relationship('User', secondary='history_product_user')
+
+
+class Question(Base, DBUtils):
+    __tablename__ = 'questions'
+
+    question_id = Column(BigInteger, primary_key=True, server_default=FetchedValue())
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    store_id = Column(ForeignKey('store.store_id'), index=True)
+    product_id = Column(ForeignKey('products.product_id'), nullable=False, index=True)
+    content = Column(String(3000), nullable=False)
+
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime, onupdate=datetime.datetime.utcnow)
+
+    product = relationship('Product', primaryjoin='Question.product_id == Product.product_id', backref='questions')
+    store = relationship('Store', primaryjoin='Question.store_id == Store.store_id', backref='questions')
+    user = relationship('User', primaryjoin='Question.user_id == User.user_id', backref='questions')
+    answers = relationship('Answer', primaryjoin='Question.question_id == Answer.question_id', backref='answers')
+
+
+class Store(Base, DBUtils):
+    __tablename__ = 'store'
+
+    store_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    name = Column(String(100), nullable=False)
+    business_name = Column(String(100))
+    nit = Column(String(15), nullable=False)
+    phone = Column(String(20), nullable=False)
+    alternative_phone = Column(String(20))
+    address = Column(String(100), nullable=False)
+    logo = Column(String(150))
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, nullable=False, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+    user = relationship('User', primaryjoin='Store.user_id == User.user_id', backref='stores')
+    products_featured = relationship('Product', secondary='products_featured')
+
+    users_follower_store = relationship('User', secondary='follower_store')
+
+
+# New table: Yuri
+class ProductSuggested(Base, DBUtils):
+    __tablename__ = 'products_suggested'
+    __table_args__ = (
+        Index('ix_products_suggested_user_id_score', 'user_id', 'score'),
+    )
+
+    product_suggested_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    # ix_products_suggested_user_id_score serves lookups by user_id
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+    # written by kiero_models.recommendations; NULL for suggestions added by hand
+    score = Column(Float)
+
+
+class ProductFavorite(Base, DBUtils):
+    __tablename__ = 'products_favorite'
+
+    product_favorite_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+
+class ProductFeaturedStore(Base, DBUtils):
+    __tablename__ = 'products_featured'
+
+    product_featured_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    store_id = Column(Integer, ForeignKey('store.store_id'), primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+
+class CategoryPreferredUser(Base, DBUtils):
+    __tablename__ = 'cetegory_preferred'
+
+    cetegory_preferred_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    category_id = Column(Integer, ForeignKey('categories.category_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+
+class ProductFeedBack(Base, DBUtils):
+    __tablename__ = 'products_feedback'
+
+    product_feedback_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+    feedback = Column(Integer)
+
+
+class FollowerStore(Base, DBUtils):
+    __tablename__ = 'follower_store'
+
+    follower_store_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    stored_id = Column(Integer, ForeignKey('store.store_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+
+class HistoryCategoryUser(Base, DBUtils):
+    __tablename__ = 'history_category_user'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'category', name='uq_history_category_user_user_id_category'),
+    )
+
+    history_category_user_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    category = Column(Integer, ForeignKey('categories.category_id'), primary_key=True, index=True)
+    product_feedback_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    product_id = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+    visitor_count = Column(Integer)
+    feedback = Column(Integer)
+
+
+class HistoryProductUser(Base, DBUtils):
+    __tablename__ = 'history_product_user'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'product', name='uq_history_product_user_user_id_product'),
+    )
+
+    history_product_user_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    product = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+    visitor_count = Column(Integer)
+
+
+class RatingProduct(Base, DBUtils):
+    __tablename__ = 'rating_products'
+
+    rating_products_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    product_id = Column(ForeignKey('products.product_id'), nullable=False, index=True)
+    value = Column(Integer, nullable=False)
+
+    user = relationship('User', primaryjoin='RatingProduct.user_id == User.user_id', backref='rating_products')
+    product = relationship('Product', primaryjoin='RatingProduct.product_id == Product.product_id',
+                           backref='rating_products')
+
+
+class SellerProductsSuggested(Base, DBUtils):
+    __tablename__ = 'seller_products_suggested'
+
+    seller_products_suggested_id = Column(Integer, primary_key=True, unique=True, server_default=FetchedValue())
+    seller_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    update_since = Column(DateTime, server_default=FetchedValue())
+
+    seller = relationship('User', primaryjoin='SellerProductsSuggested.seller_id == User.user_id',
+                          backref='seller_products_suggested')
+    products = relationship('Product', primaryjoin='SellerProductsSuggested.product_id == Product.product_id',
+                            backref='seller_products_suggested')
+
+
+class ProductGlobal(Base, DBUtils):
+    __tablename__ = 'products_global'
+
+    product_global_id = Column(Integer, primary_key=True, unique=True, autoincrement=True)
+    product_id = Column(Integer, ForeignKey('products.product_id'), primary_key=True, index=True)
+    active = Column(Boolean, default=True)
+    is_variant = Column(Boolean, default=False)
+    product_asin = Column(String(20), unique=True)
+    price = Column(Money, nullable=False)
+    package_weight = Column(Numeric(10, 2))
+    color = Column(String(80))
+    title = Column(String(800), nullable=False)
+    size = Column(String(8))
+    url = Column(String(200), nullable=True)
+    #product = relationship('Product', foreign_keys=product_id)
+    product = relationship('Product', primaryjoin='ProductGlobal.product_id == Product.product_id',
+                           backref='product_global_products')
+    product_variants = relationship('ProductVariant', lazy=True,
+                                    foreign_keys='ProductVariant.product_global_id', cascade="all, delete")
+    product_files = relationship('FileGlobal', lazy=True,
+                                    foreign_keys='FileGlobal.product_global_id', cascade="all, delete")
+    images = relationship('FileGlobal', primaryjoin='ProductGlobal.product_global_id == FileGlobal.product_global_id', backref='files')
+
+
+class ProductVariant(Base, DBUtils):
+    __tablename__ = 'products_global_variants'
+
+    product_variant_id = Column(Integer, primary_key=True, unique=True, autoincrement=True)
+    product_global_id = Column(Integer, ForeignKey('products_global.product_global_id'), primary_key=True,
+                               index=True)
+    variant_id = Column(Integer, ForeignKey('variants.variant_id'), primary_key=True, index=True)
+    variant = relationship('Variant', foreign_keys=variant_id)
+    product_global = relationship('ProductGlobal', foreign_keys=product_global_id)
+
+
+class Variant(Base, DBUtils):
+    __tablename__ = 'variants'
+
+    variant_id = Column(Integer, primary_key=True, unique=True, autoincrement=True)
+    dimension_id = Column(Integer, ForeignKey('dimensions.dimension_id'), primary_key=True)
+    html_color = Column(String(20))
+    value = Column(String(100))
+    dimension = relationship('Dimension', foreign_keys=dimension_id,lazy='subquery')
+
+
+class Dimension(Base, DBUtils):
+    __tablename__ = 'dimensions'
+
+    dimension_id = Column(Integer, primary_key=True, unique=True, autoincrement=True)
+    name = Column(String(20))
+    display_type = Column(String(20))
+
+
+class FileGlobal(Base, DBUtils):
+    __tablename__ = 'files_global'
+
+    file_id = Column(BigInteger, primary_key=True, unique=True, autoincrement=True)
+    product_global_id = Column(ForeignKey('products_global.product_global_id'), nullable=False, index=True)
+    url = Column(String(200), nullable=False)
+    main = Column(SmallInteger, server_default=FetchedValue())
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime, onupdate=datetime.datetime.utcnow)
+    file_product_global = relationship('ProductGlobal', primaryjoin='FileGlobal.product_global_id == ProductGlobal.product_global_id', backref='files')
+
+
+class ProductCopy(Base, DBUtils):
+    __tablename__ = 'products_errors'
+
+    product_id = Column(Integer, primary_key=True, autoincrement=True)
+    error = Column(String(800), nullable=False)
+
+
+class StoreDetails(Base, DBUtils):
+    __tablename__ = 'store_details'
+
+    store_details_id = Column(Integer, primary_key=True, autoincrement=True)
+    store_id = Column(ForeignKey('store.store_id'), nullable=False, index=True)
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    visit = Column(Integer)
+    domain = Column(String(100), unique=True)
+    design = Column(String(100))
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+    user = relationship('User', primaryjoin='StoreDetails.user_id == User.user_id', backref='store_details')
+    store = relationship('Store', primaryjoin='StoreDetails.store_id == Store.store_id', backref='store_details')
+    google_analytic = Column(String(100))
+    template_id = Column(String(100))
+    facebook_pixel = Column(String(100))
+    facebook_vinculate = Column(Boolean, default=False)
+    google_ads_intention = Column(String(100))
+    google_ads_confirmation_hashtag = Column(String(100))
+    google_ads_confirmation_fragment = Column(String(100))
+    google_ads_remarketing_hashtag = Column(String(100))
+    google_ads_remarketing_fragment = Column(String(100))
+
+
+class ProductDetails(Base, DBUtils):
+    __tablename__ = 'product_details'
+
+    product_details_id = Column(Integer, primary_key=True, autoincrement=True)
+    store_id = Column(ForeignKey('store.store_id'), nullable=False, index=True)
+    product_id = Column(ForeignKey('products.product_id'), nullable=False, index=True)
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    store_details_id = Column(ForeignKey('store_details.store_details_id'), nullable=False)
+    is_features = Column(Integer, server_default=FetchedValue())
+    sold = Column(Integer, server_default=FetchedValue())
+    on_sale = Column(Integer, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime, onupdate=datetime.datetime.utcnow)
+
+    store = relationship('Store', primaryjoin='ProductDetails.store_id == Store.store_id', backref='product_details')
+    user = relationship('User', primaryjoin='ProductDetails.user_id == User.user_id', backref='product_details')
+    product = relationship('Product', primaryjoin='ProductDetails.product_id == Product.product_id', backref='product_details')
+    store_details = relationship('StoreDetails', primaryjoin='ProductDetails.store_details_id == StoreDetails.store_details_id', backref='product_details')
+
+
+class Banner(Base, DBUtils):
+    __tablename__ = 'm_banner'
+
+    banner_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    my_url = Column(String(200), nullable=False)
+    url = Column(String(200), nullable=False)
+    created_since = Column(DateTime, server_default=FetchedValue())
+
+
+class ImageCategory(Base, DBUtils):
+    __tablename__ = 'm_image_category'
+
+    image_category_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    url = Column(String(200), nullable=False)
+    category_id = Column(Integer, nullable=False)
+    created_since = Column(DateTime, server_default=FetchedValue())
+
+
+class Answer(Base, DBUtils):
+    __tablename__ = 'answers'
+
+    answers_id = Column(BigInteger,  primary_key=True, autoincrement=True)
+    question_id = Column(ForeignKey('questions.question_id'), nullable=False, index=True)
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    content = Column(String(3000), nullable=False)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime, onupdate=datetime.datetime.utcnow)
+
+    user = relationship('User', primaryjoin='Answer.user_id == User.user_id', backref='users')
+
+
+
+class ProductStats(Base, DBUtils):
+    """Counters kept by kiero_models.aggregates; read these instead of scanning the child tables."""
+    __tablename__ = 'product_stats'
+
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), primary_key=True,
+                        autoincrement=False)
+    store_id = Column(ForeignKey('store.store_id'), index=True)
+    rating_sum = Column(Integer, nullable=False, server_default='0')
+    rating_count = Column(Integer, nullable=False, server_default='0')
+    purchase_rating_sum = Column(Integer, nullable=False, server_default='0')
+    purchase_rating_count = Column(Integer, nullable=False, server_default='0')
+    order_count = Column(Integer, nullable=False, server_default='0')
+    units_sold = Column(Integer, nullable=False, server_default='0')
+    questions_open = Column(Integer, nullable=False, server_default='0')
+    updated_since = Column(DateTime)
+
+    product = relationship('Product', primaryjoin='ProductStats.product_id == Product.product_id',
+                           backref=backref('stats', uselist=False, viewonly=True), viewonly=True)
+
+    @property
+    def rating_average(self):
+        return self.rating_sum / float(self.rating_count) if self.rating_count else None
+
+
+class StoreStats(Base, DBUtils):
+    """Sums of product_stats per store, kept by kiero_models.aggregates."""
+    __tablename__ = 'store_stats'
+
+    store_id = Column(Integer, ForeignKey('store.store_id', ondelete='CASCADE'), primary_key=True,
+                      autoincrement=False)
+    rating_sum = Column(Integer, nullable=False, server_default='0')
+    rating_count = Column(Integer, nullable=False, server_default='0')
+    purchase_rating_sum = Column(Integer, nullable=False, server_default='0')
+    purchase_rating_count = Column(Integer, nullable=False, server_default='0')
+    order_count = Column(Integer, nullable=False, server_default='0')
+    units_sold = Column(Integer, nullable=False, server_default='0')
+    questions_open = Column(Integer, nullable=False, server_default='0')
+    updated_since = Column(DateTime)
+
+    store = relationship('Store', primaryjoin='StoreStats.store_id == Store.store_id',
+                         backref=backref('stats', uselist=False, viewonly=True), viewonly=True)
+
+    @property
+    def rating_average(self):
+        return self.rating_sum / float(self.rating_count) if self.rating_count else None
+
+# User relationships into this group, added here so the users group loads on its own
+User.products_suggested = relationship('Product', secondary='products_suggested')
+User.products_favorite = relationship('Product', secondary='products_favorite')
+User.categories_preferred = relationship('Category', secondary='cetegory_preferred')
+User.stories_qualify = relationship('Store')
+User.stories_follower = relationship('Store', secondary='follower_store')
+User.categories_history = relationship('Category', secondary='history_category_user')
+User.products_history = relationship('Product', secondary='history_product_user')
@@ -0,0 +1,210 @@
+# coding: utf-8
+"""In-process index of the Category hierarchy.
+
+The whole table is read in one query; parents, children, depth and
+ancestors are then plain dict lookups. watch() keeps the index current from
+the Category mapper events, so a changed row only re-walks its own subtree;
+the rows a flush wrote are applied when its session commits and dropped if
+it rolls back.
+"""
+import threading
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from .catalog import Category, Product
+
+
+class CategoryNode(object):
+    __slots__ = ('category_id', 'parent_id', 'name', 'fullname', 'in_menu', 'status')
+
+    def __init__(self, category_id, parent_id, name, fullname, in_menu, status):
+        self.category_id = category_id
+        self.parent_id = parent_id
+        self.name = name
+        self.fullname = fullname
+        self.in_menu = in_menu
+        self.status = status
+
+    def json(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class CategoryTree(object):
+    def __init__(self, nodes=()):
+        self._lock = threading.RLock()
+        self.nodes = {}
+        self._children = {None: []}
+        self._ancestors = {}
+        self._descendants = {}
+        self._pending = 'category_tree_pending_%x' % id(self)
+        for node in nodes:
+            self.nodes[node.category_id] = node
+        for node in self.nodes.values():
+            self._children.setdefault(node.category_id, [])
+            self._children.setdefault(self._parent_key(node), []).append(node.category_id)
+        for root in self._children[None]:
+            self._walk(root, ())
+        for cid in self.nodes:
+            # parent chains that loop without reaching a root
+            if cid not in self._ancestors:
+                self._children[self._parent_key(self.nodes[cid])].remove(cid)
+                self._children[None].append(cid)
+                self._walk(cid, ())
+
+    @classmethod
+    def load(cls, bind):
+        """Build the index from one SELECT over categories; `bind` is a Session or Connection."""
+        return cls(CategoryNode(*row) for row in bind.execute(_select_nodes()))
+
+    def __contains__(self, category_id):
+        return category_id in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, category_id):
+        return self.nodes.get(category_id)
+
+    def parent(self, category_id):
+        return self.nodes.get(self.nodes[category_id].parent_id)
+
+    def children(self, category_id=None, in_menu=None):
+        ids = self._children.get(category_id, ())
+        return [self.nodes[cid] for cid in ids if in_menu is None or bool(self.nodes[cid].in_menu) == in_menu]
+
+    def roots(self, in_menu=None):
+        return self.children(None, in_menu)
+
+    def ancestors(self, category_id):
+        """Ids from the root down to the parent of `category_id`."""
+        return self._ancestors[category_id]
+
+    def depth(self, category_id):
+        return len(self._ancestors[category_id])
+
+    def breadcrumb(self, category_id):
+        return [self.nodes[cid] for cid in self._ancestors[category_id] + (category_id,)]
+
+    def is_descendant(self, category_id, ancestor_id):
+        return ancestor_id in self._ancestors.get(category_id, ())
+
+    def descendants(self, category_id, include_self=False):
+        with self._lock:
+            ids = self._descendants.get(category_id)
+            if ids is None:
+                found = []
+                stack = list(self._children.get(category_id, ()))
+                while stack:
+                    cid = stack.pop()
+                    found.append(cid)
+                    stack.extend(self._children.get(cid, ()))
+                ids = self._descendants[category_id] = frozenset(found)
+        return ids | {category_id} if include_self else ids
+
+    def menu(self, category_id=None):
+        """Nested dicts of the in_menu categories below `category_id` (the roots by default)."""
+        return [dict(node.json(), children=self.menu(node.category_id))
+                for node in self.children(category_id, in_menu=True)]
+
+    def product_filter(self, category_id, include_self=True):
+        """Criterion for the products of a whole subtree."""
+        return Product.category_id.in_(sorted(self.descendants(category_id, include_self)))
+
+    def update(self, node):
+        """Insert or replace one category and re-walk its subtree if it moved."""
+        with self._lock:
+            old = self.nodes.get(node.category_id)
+            self.nodes[node.category_id] = node
+            self._children.setdefault(node.category_id, [])
+            if old is not None and self._parent_key(old) == self._parent_key(node):
+                return
+            if old is not None:
+                self._children[self._parent_key(old)].remove(node.category_id)
+            else:
+                orphans = [cid for cid in self._children[None] if self.nodes[cid].parent_id == node.category_id]
+                for cid in orphans:
+                    self._children[None].remove(cid)
+                    self._children[node.category_id].append(cid)
+            self._children.setdefault(self._parent_key(node), []).append(node.category_id)
+            parent = self._parent_key(node)
+            self._walk(node.category_id, () if parent is None else self._ancestors[parent] + (parent,))
+            self._descendants.clear()
+
+    def remove(self, category_id):
+        """Drop one category; its children are re-attached as roots."""
+        with self._lock:
+            node = self.nodes.pop(category_id, None)
+            if node is None:
+                return
+            self._children[self._parent_key(node)].remove(category_id)
+            for child in self._children.pop(category_id, []):
+                self._children[None].append(child)
+                self._walk(child, ())
+            self._ancestors.pop(category_id, None)
+            self._descendants.clear()
+
+    def watch(self):
+        for name in ('after_insert', 'after_update'):
+            event.listen(Category, name, self._on_save)
+        event.listen(Category, 'after_delete', self._on_delete)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_soft_rollback', self._after_rollback)
+        return self
+
+    def unwatch(self):
+        for name in ('after_insert', 'after_update'):
+            event.remove(Category, name, self._on_save)
+        event.remove(Category, 'after_delete', self._on_delete)
+        event.remove(Session, 'after_commit', self._after_commit)
+        event.remove(Session, 'after_soft_rollback', self._after_rollback)
+
+    def _on_save(self, mapper, connection, target):
+        # read the row back: server defaults such as in_menu are not on the instance yet
+        row = connection.execute(_select_nodes().where(Category.__table__.c.category_id == target.category_id)).first()
+        if row is not None:
+            self._buffer(target, CategoryNode(*row))
+
+    def _on_delete(self, mapper, connection, target):
+        self._buffer(target, None)
+
+    def _buffer(self, target, node):
+        session = object_session(target)
+        if session is None:
+            self._apply({target.category_id: node})
+        else:
+            session.info.setdefault(self._pending, {})[target.category_id] = node
+
+    def _apply(self, changes):
+        for category_id, node in changes.items():
+            if node is None:
+                self.remove(category_id)
+            else:
+                self.update(node)
+
+    def _after_commit(self, session):
+        changes = session.info.pop(self._pending, None)
+        if changes:
+            self._apply(changes)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(self._pending, None)
+
+    def _parent_key(self, node):
+        # rows pointing at a missing parent are treated as roots
+        return node.parent_id if node.parent_id in self.nodes else None
+
+    def _walk(self, category_id, ancestors):
+        stack = [(category_id, ancestors)]
+        while stack:
+            cid, path = stack.pop()
+            if cid in path:
+                continue
+            self._ancestors[cid] = path
+            stack.extend((child, path + (cid,)) for child in self._children.get(cid, ()))
+
+
+def _select_nodes():
+    cols = Category.__table__.c
+    return select(cols.category_id, cols.parent_id, cols.name, cols.fullname, cols.in_menu, cols.status)
@@ -0,0 +1,65 @@
+# coding: utf-8
+"""Chat rooms and their messages."""
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, SmallInteger, Text, Index
+from sqlalchemy.schema import FetchedValue
+from sqlalchemy.orm import backref, relationship
+
+from .base import Base, DBUtils
+from .pagination import KeysetPaginated
+from . import catalog  # noqa: F401, chat_room references users and store
+
+
+class ChatRoom(Base, DBUtils):
+    __tablename__ = 'chat_room'
+
+    room_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    store_id = Column(ForeignKey('store.store_id'), nullable=False, index=True)
+    seller_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, nullable=False, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+    # store = relationship('Store', primaryjoin='ChatRoom.store_id == Store.store_id', backref='chat_rooms')
+    user = relationship('User', primaryjoin='ChatRoom.user_id == User.user_id', backref='chat_rooms')
+    seller = relationship('User', primaryjoin='ChatRoom.seller_id == User.user_id')
+
+
+class Message(Base, DBUtils, KeysetPaginated):
+    __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_room_id_created_since', 'room_id', 'created_since', 'message_id'),
+    )
+    __keyset__ = ('created_since', 'message_id')
+    __partition__ = 'created_since'
+
+    message_id = Column(BigInteger, primary_key=True, server_default=FetchedValue())
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    room_id = Column(ForeignKey('chat_room.room_id'), nullable=False)
+    content = Column(Text)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, nullable=False, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+    room = relationship('ChatRoom', primaryjoin='Message.room_id == ChatRoom.room_id', backref='messages')
+    user = relationship('User', primaryjoin='Message.user_id == User.user_id', backref='messages')
+
+
+class ChatRoomSummary(Base, DBUtils):
+    """Last message and per-participant read state of a room, kept by kiero_models.inbox."""
+    __tablename__ = 'chat_room_summary'
+
+    room_id = Column(Integer, ForeignKey('chat_room.room_id', ondelete='CASCADE'), primary_key=True,
+                     autoincrement=False)
+    last_message_id = Column(BigInteger)
+    last_message_at = Column(DateTime, index=True)
+    message_count = Column(Integer, nullable=False, server_default='0')
+    # read watermarks (highest message_id read) and unread counts of chat_room.user_id and chat_room.seller_id
+    user_read_id = Column(BigInteger, nullable=False, server_default='0')
+    seller_read_id = Column(BigInteger, nullable=False, server_default='0')
+    user_unread = Column(Integer, nullable=False, server_default='0')
+    seller_unread = Column(Integer, nullable=False, server_default='0')
+    updated_since = Column(DateTime)
+
+    room = relationship('ChatRoom', primaryjoin='ChatRoomSummary.room_id == ChatRoom.room_id',
+                        backref=backref('summary', uselist=False, viewonly=True), viewonly=True)
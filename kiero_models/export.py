@@ -0,0 +1,82 @@
+# coding: utf-8
+"""Streaming NDJSON / CSV export of whole tables.
+
+Rows are read as plain column tuples through a server-side cursor
+(stream_results + yield_per) and never become ORM instances, so nothing
+accumulates in the session identity map and memory stays flat whatever the
+table size. Values follow the column rules of DBUtils.json.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from .serializer import to_json_value
+
+CHUNK_SIZE = 1000
+
+
+def iter_rows(bind, model, *criteria, chunk_size=CHUNK_SIZE):
+    """Yield lists of up to `chunk_size` dicts shaped like model.json().
+
+    `bind` is a Session or a Connection.
+    """
+    table = model.__table__
+    names = [col.name for col in table.columns]
+    stmt = select(*table.columns).where(*criteria).order_by(*table.primary_key.columns)
+    stmt = stmt.execution_options(stream_results=True, yield_per=chunk_size)
+    result = bind.execute(stmt)
+    try:
+        for rows in result.partitions(chunk_size):
+            yield [
+                {name: to_json_value(val) for name, val in zip(names, row)}
+                for row in rows
+            ]
+    finally:
+        result.close()
+
+
+def iter_ndjson(bind, model, *criteria, chunk_size=CHUNK_SIZE):
+    for rows in iter_rows(bind, model, *criteria, chunk_size=chunk_size):
+        yield _ndjson(rows)
+
+
+def iter_csv(bind, model, *criteria, chunk_size=CHUNK_SIZE, header=True):
+    names = [col.name for col in model.__table__.columns]
+    if header:
+        yield _csv([dict(zip(names, names))], names)
+    for rows in iter_rows(bind, model, *criteria, chunk_size=chunk_size):
+        yield _csv(rows, names)
+
+
+def export_ndjson(bind, model, fileobj, *criteria, chunk_size=CHUNK_SIZE):
+    """Write the table to `fileobj` as NDJSON and return the number of rows."""
+    count = 0
+    for rows in iter_rows(bind, model, *criteria, chunk_size=chunk_size):
+        fileobj.write(_ndjson(rows))
+        count += len(rows)
+    return count
+
+
+def export_csv(bind, model, fileobj, *criteria, chunk_size=CHUNK_SIZE, header=True):
+    """Write the table to `fileobj` as CSV and return the number of rows."""
+    names = [col.name for col in model.__table__.columns]
+    if header:
+        fileobj.write(_csv([dict(zip(names, names))], names))
+    count = 0
+    for rows in iter_rows(bind, model, *criteria, chunk_size=chunk_size):
+        fileobj.write(_csv(rows, names))
+        count += len(rows)
+    return count
+
+
+def _ndjson(rows):
+    return ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+
+
+def _csv(rows, names):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerows([['' if row[name] is None else row[name] for name in names] for row in rows])
+    return buf.getvalue()
@@ -0,0 +1,200 @@
+# coding: utf-8
+"""Chat inbox in one query: each room's peer, store, last message and unread count.
+
+chat_room_summary holds, per room, the last message and a read watermark
+and unread counter for each participant (chat_room.user_id, the buyer, and
+chat_room.seller_id). With watch() installed every inserted Message updates
+its room's row in the same flush, so inbox() is one indexed join whatever
+the history size:
+
+    inbox.rebuild(conn)                      # once: summarise the existing history
+    inbox.watch()
+    entries = inbox.inbox(session, user_id, limit=20)
+    # [{'room_id': 3, 'peer': {...}, 'store': {...}, 'last_message': {...}, 'unread': 2, ...}]
+    inbox.mark_read(session, room_id, user_id)
+
+inbox(..., summary=False) computes the last message with a window function
+over the messages of the user's rooms instead; it needs no maintained
+counters (only the read watermarks) but reads every message of those rooms.
+Rows written with Core inserts bypass watch(); refresh them with rebuild().
+"""
+import datetime
+
+from sqlalchemy import and_, case, event, func, inspect, or_, select, update
+from sqlalchemy.orm import aliased
+
+from .catalog import Store
+from .chat import ChatRoom, ChatRoomSummary, Message
+from .serializer import to_json_value
+from .upsert import connection_for, upsert
+from .users import User
+
+PEER_FIELDS = ('user_id', 'name', 'last_name', 'photo')
+STORE_FIELDS = ('store_id', 'name', 'logo')
+MESSAGE_FIELDS = ('message_id', 'user_id', 'content', 'status', 'created_since')
+
+
+def record_message(bind, room_id, message_id, sender_id, created_since=None):
+    """Account for a new message: it becomes the last one, is read by its sender and unread by the peer."""
+    conn = connection_for(bind)
+    summary = ChatRoomSummary.__table__
+    room = ChatRoom.__table__
+    buyer = select(room.c.user_id).where(room.c.room_id == room_id).scalar_subquery()
+    from_buyer = buyer == sender_id
+    if created_since is None:
+        messages = Message.__table__
+        created_since = select(messages.c.created_since).where(messages.c.message_id == message_id).scalar_subquery()
+    stmt = update(summary).where(summary.c.room_id == room_id).values(
+        last_message_id=case((summary.c.last_message_id > message_id, summary.c.last_message_id),
+                             else_=message_id),
+        last_message_at=case((summary.c.last_message_id > message_id, summary.c.last_message_at),
+                             else_=created_since),
+        message_count=summary.c.message_count + 1,
+        user_read_id=case((from_buyer, message_id), else_=summary.c.user_read_id),
+        user_unread=case((from_buyer, 0), else_=summary.c.user_unread + 1),
+        seller_read_id=case((from_buyer, summary.c.seller_read_id), else_=message_id),
+        seller_unread=case((from_buyer, summary.c.seller_unread + 1), else_=0),
+        updated_since=datetime.datetime.utcnow())
+    if conn.execute(stmt).rowcount == 0:
+        # first message of the room: create its row, then count the message like any other
+        upsert(conn, summary, [dict(room_id=room_id, message_count=0, user_read_id=0, seller_read_id=0,
+                                    user_unread=0, seller_unread=0)],
+               ('room_id',), update=lambda incoming: {})
+        conn.execute(stmt)
+
+
+def mark_read(bind, room_id, user_id, message_id=None):
+    """Move `user_id`'s read watermark in the room to `message_id` (default: the last message); returns unread."""
+    conn = connection_for(bind)
+    summary = ChatRoomSummary.__table__
+    room = conn.execute(select(ChatRoom.user_id, ChatRoom.seller_id).where(ChatRoom.room_id == room_id)).one()
+    if user_id not in room:
+        raise ValueError('user %s is not in chat room %s' % (user_id, room_id))
+    if message_id is None:
+        message_id = conn.execute(select(func.max(Message.message_id)).where(Message.room_id == room_id)).scalar()
+    message_id = message_id or 0
+    unread = conn.execute(select(func.count()).where(Message.room_id == room_id, Message.user_id != user_id,
+                                                     Message.message_id > message_id)).scalar()
+    prefix = 'user' if user_id == room.user_id else 'seller'
+    values = {prefix + '_read_id': message_id, prefix + '_unread': unread}
+    if conn.execute(update(summary).where(summary.c.room_id == room_id).values(**values)).rowcount == 0:
+        rebuild(conn, [room_id])
+        conn.execute(update(summary).where(summary.c.room_id == room_id).values(**values))
+    return unread
+
+
+def rebuild(bind, room_ids=None):
+    """Recompute the summaries of `room_ids` (all rooms with messages by default) from the messages.
+
+    Existing read watermarks are kept; rooms without a summary yet start
+    with everything read, so enabling the summary does not flag old
+    messages as unread.
+    """
+    conn = connection_for(bind)
+    states = ChatRoomSummary.__table__
+    messages = Message.__table__
+    room = ChatRoom.__table__
+
+    def unread(reader, read_id):
+        newer = and_(read_id.isnot(None), messages.c.user_id != reader, messages.c.message_id > read_id)
+        return func.sum(case((newer, 1), else_=0))
+
+    stmt = select(messages.c.room_id, func.max(messages.c.message_id), func.count(),
+                  states.c.user_read_id, states.c.seller_read_id,
+                  unread(room.c.user_id, states.c.user_read_id), unread(room.c.seller_id, states.c.seller_read_id)) \
+        .select_from(messages.join(room, room.c.room_id == messages.c.room_id)
+                     .outerjoin(states, states.c.room_id == messages.c.room_id)) \
+        .group_by(messages.c.room_id, states.c.user_read_id, states.c.seller_read_id)
+    if room_ids is not None:
+        stmt = stmt.where(messages.c.room_id.in_(room_ids))
+    totals = conn.execute(stmt).all()
+    if not totals:
+        return 0
+    last_at = dict(conn.execute(select(messages.c.message_id, messages.c.created_since)
+                                .where(messages.c.message_id.in_([row[1] for row in totals]))).all())
+    now = datetime.datetime.utcnow()
+    rows = [dict(room_id=room_id, last_message_id=last_id, last_message_at=last_at.get(last_id),
+                 message_count=count,
+                 user_read_id=last_id if user_read is None else user_read,
+                 seller_read_id=last_id if seller_read is None else seller_read,
+                 user_unread=user_unread or 0, seller_unread=seller_unread or 0, updated_since=now)
+            for room_id, last_id, count, user_read, seller_read, user_unread, seller_unread in totals]
+    upsert(conn, states, rows, ('room_id',))
+    return len(rows)
+
+
+def inbox(bind, user_id, limit=20, offset=0, summary=True):
+    """The user's rooms, most recent conversation first, as json-ready dicts."""
+    conn = connection_for(bind)
+    room = ChatRoom.__table__
+    states = ChatRoomSummary.__table__
+    is_buyer = room.c.user_id == user_id
+    peer = aliased(User.__table__, name='peer')
+    store = Store.__table__
+    if summary:
+        last = aliased(Message.__table__, name='last_message')
+        unread = case((is_buyer, states.c.user_unread), else_=states.c.seller_unread)
+        source = room.outerjoin(states, states.c.room_id == room.c.room_id) \
+            .outerjoin(last, last.c.message_id == states.c.last_message_id)
+        recent = states.c.last_message_at
+    else:
+        last = _last_messages(user_id)
+        unread = last.c.unread
+        source = room.outerjoin(last, last.c.room_id == room.c.room_id)
+        recent = last.c.created_since
+    source = source.join(peer, peer.c.user_id == case((is_buyer, room.c.seller_id), else_=room.c.user_id)) \
+        .join(store, store.c.store_id == room.c.store_id)
+    stmt = select(room.c.room_id, room.c.status, func.coalesce(unread, 0),
+                  *([peer.c[name] for name in PEER_FIELDS] + [store.c[name] for name in STORE_FIELDS]
+                    + [last.c[name] for name in MESSAGE_FIELDS])) \
+        .select_from(source) \
+        .where(or_(room.c.user_id == user_id, room.c.seller_id == user_id)) \
+        .order_by(recent.desc().nullslast(), room.c.room_id.desc()) \
+        .limit(limit).offset(offset)
+    return [_entry(row) for row in conn.execute(stmt)]
+
+
+def _last_messages(user_id):
+    """Per room of `user_id`: its last message and the messages the user has not read."""
+    messages = Message.__table__
+    room = ChatRoom.__table__
+    states = ChatRoomSummary.__table__
+    read_id = func.coalesce(case((room.c.user_id == user_id, states.c.user_read_id),
+                                 else_=states.c.seller_read_id), 0)
+    ranked = select(*[messages.c[name] for name in MESSAGE_FIELDS], messages.c.room_id,
+                    # the highest message_id, as in chat_room_summary, even if a later id has an older time
+                    func.row_number().over(partition_by=messages.c.room_id,
+                                           order_by=messages.c.message_id.desc()).label('position'),
+                    func.sum(case((and_(messages.c.user_id != user_id, messages.c.message_id > read_id), 1),
+                                  else_=0)).over(partition_by=messages.c.room_id).label('unread')) \
+        .select_from(messages.join(room, room.c.room_id == messages.c.room_id)
+                     .outerjoin(states, states.c.room_id == messages.c.room_id)) \
+        .where(or_(room.c.user_id == user_id, room.c.seller_id == user_id)) \
+        .subquery()
+    return select(ranked).where(ranked.c.position == 1).subquery('last_message')
+
+
+def _entry(row):
+    values = [to_json_value(value) for value in row]
+    room_id, status, unread = values[:3]
+    peer = dict(zip(PEER_FIELDS, values[3:3 + len(PEER_FIELDS)]))
+    offset = 3 + len(PEER_FIELDS)
+    store = dict(zip(STORE_FIELDS, values[offset:offset + len(STORE_FIELDS)]))
+    offset += len(STORE_FIELDS)
+    message = dict(zip(MESSAGE_FIELDS, values[offset:]))
+    return {'room_id': room_id, 'status': status, 'unread': unread, 'peer': peer, 'store': store,
+            'last_message': message if message['message_id'] is not None else None}
+
+
+def _on_insert(mapper, connection, target):
+    # created_since may be a server default not fetched yet; record_message() then reads it
+    record_message(connection, target.room_id, target.message_id, target.user_id,
+                   inspect(target).dict.get('created_since'))
+
+
+def watch():
+    event.listen(Message, 'after_insert', _on_insert)
+
+
+def unwatch():
+    event.remove(Message, 'after_insert', _on_insert)
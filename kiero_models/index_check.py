@@ -0,0 +1,88 @@
+# coding: utf-8
+"""Compare the indexes declared on the models with a live database.
+
+    python -m kiero_models.index_check postgresql://user@host/kiero [--create]
+
+An index counts as present when the database has an index, primary key or
+unique constraint whose leading columns are the declared columns.
+"""
+import sys
+
+from sqlalchemy import create_engine, inspect
+
+from .kiero_models import Base
+
+
+class MissingIndex(object):
+    def __init__(self, index):
+        self.index = index
+        self.table = index.table.name
+        self.name = index.name
+        self.columns = tuple(col.name for col in index.columns)
+
+    def __repr__(self):
+        return '<MissingIndex %s on %s(%s)>' % (self.name, self.table, ', '.join(self.columns))
+
+
+def live_indexes(inspector, table_name, schema=None):
+    found = [tuple(idx['column_names']) for idx in inspector.get_indexes(table_name, schema=schema)]
+    pk = inspector.get_pk_constraint(table_name, schema=schema).get('constrained_columns')
+    if pk:
+        found.append(tuple(pk))
+    found.extend(tuple(uq['column_names']) for uq in inspector.get_unique_constraints(table_name, schema=schema))
+    return found
+
+
+def missing_indexes(bind, metadata=None):
+    """Declared indexes the database behind `bind` lacks, for tables that exist there."""
+    metadata = metadata if metadata is not None else Base.metadata
+    inspector = inspect(bind)
+    missing = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name, schema=table.schema):
+            continue
+        live = live_indexes(inspector, table.name, table.schema)
+        for index in sorted(table.indexes, key=lambda idx: idx.name or ''):
+            columns = tuple(col.name for col in index.columns)
+            if not any(existing[:len(columns)] == columns for existing in live):
+                missing.append(MissingIndex(index))
+    return missing
+
+
+def unindexed_foreign_keys(metadata=None):
+    """(table, column) pairs whose foreign key is not the leading column of any declared index."""
+    metadata = metadata if metadata is not None else Base.metadata
+    result = []
+    for table in metadata.sorted_tables:
+        leading = {idx.columns.values()[0].name for idx in table.indexes if len(idx.columns)}
+        if len(table.primary_key.columns):
+            leading.add(table.primary_key.columns.values()[0].name)
+        for fk in sorted(table.foreign_keys, key=lambda fk: fk.parent.name):
+            if fk.parent.name not in leading:
+                result.append((table.name, fk.parent.name))
+    return result
+
+
+def create_missing(bind, metadata=None):
+    created = missing_indexes(bind, metadata)
+    for item in created:
+        item.index.create(bind)
+    return created
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        sys.stderr.write('usage: python -m kiero_models.index_check DATABASE_URL [--create]\n')
+        return 2
+    engine = create_engine(argv[0])
+    with engine.begin() as conn:
+        missing = create_missing(conn) if '--create' in argv else missing_indexes(conn)
+    for item in missing:
+        print('%s %s %s(%s)' % ('created' if '--create' in argv else 'missing', item.name, item.table,
+                                ', '.join(item.columns)))
+    return 1 if missing and '--create' not in argv else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
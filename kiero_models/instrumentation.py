@@ -0,0 +1,178 @@
+# coding: utf-8
+"""Opt-in query counting and timing for code using the models.
+
+install() hooks the engine cursor events and the ORM do_orm_execute event;
+nothing is recorded outside a scope:
+
+    install(engine)
+    with record_queries() as stats:
+        products = Product.query.all()
+        [p.json('images') for p in products]
+    stats.report()   # {'count': 201, ..., 'by_label': {'Product.images lazy load': 200, ...}}
+
+    with assert_max_queries(3):
+        json_many(Product.query, 'images', 'category')
+"""
+import contextlib
+import contextvars
+import math
+import re
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+_scopes = contextvars.ContextVar('kiero_models_query_scopes', default=())
+_label = contextvars.ContextVar('kiero_models_query_label', default=None)
+_installed = set()
+_TABLE = re.compile(r'\b(?:INTO|FROM|UPDATE)\s+"?(\w+)', re.IGNORECASE)
+
+
+class QueryStats(object):
+    def __init__(self, name=None):
+        self.name = name
+        self.durations = []
+        self.by_label = {}
+        self.statements = []
+        self.keep_statements = False
+
+    @property
+    def count(self):
+        return len(self.durations)
+
+    @property
+    def total(self):
+        return sum(self.durations)
+
+    def percentile(self, pct):
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        # nearest rank
+        index = max(0, min(len(ordered) - 1, int(math.ceil(pct / 100.0 * len(ordered))) - 1))
+        return ordered[index]
+
+    def add(self, label, duration, statement):
+        self.durations.append(duration)
+        count, total = self.by_label.get(label, (0, 0.0))
+        self.by_label[label] = (count + 1, total + duration)
+        if self.keep_statements:
+            self.statements.append((label, duration, statement))
+
+    def report(self):
+        return {
+            'name': self.name,
+            'count': self.count,
+            'total': self.total,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'by_label': {label: count for label, (count, _) in
+                         sorted(self.by_label.items(), key=lambda item: -item[1][0])},
+        }
+
+    def __repr__(self):
+        return '<QueryStats %s: %d queries, %.1f ms>' % (self.name or '', self.count, self.total * 1000)
+
+
+def install(engine=None):
+    """Listen on `engine` (every Engine when omitted) and on every Session."""
+    target = engine if engine is not None else Engine
+    if target not in _installed:
+        event.listen(target, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(target, 'after_cursor_execute', _after_cursor_execute)
+        _installed.add(target)
+    if Session not in _installed:
+        event.listen(Session, 'do_orm_execute', _do_orm_execute)
+        _installed.add(Session)
+
+
+def uninstall():
+    for target in list(_installed):
+        if target is Session:
+            event.remove(Session, 'do_orm_execute', _do_orm_execute)
+        else:
+            event.remove(target, 'before_cursor_execute', _before_cursor_execute)
+            event.remove(target, 'after_cursor_execute', _after_cursor_execute)
+        _installed.discard(target)
+
+
+@contextlib.contextmanager
+def record_queries(name=None, keep_statements=False):
+    """Record every statement run in this context (nested scopes all count them)."""
+    stats = QueryStats(name)
+    stats.keep_statements = keep_statements
+    token = _scopes.set(_scopes.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _scopes.reset(token)
+
+
+@contextlib.contextmanager
+def assert_max_queries(limit, name=None):
+    with record_queries(name, keep_statements=True) as stats:
+        yield stats
+    if stats.count > limit:
+        raise AssertionError('expected at most %d queries, got %d: %r'
+                             % (limit, stats.count, stats.report()['by_label']))
+
+
+def init_app(app, logger=None):
+    """Record one scope per Flask request, available as flask.g.query_stats."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_query_scope():
+        g.query_stats = QueryStats(request.endpoint)
+        _scopes.set(_scopes.get() + (g.query_stats,))
+
+    @app.teardown_request
+    def _end_query_scope(exc):
+        stats = g.get('query_stats')
+        if stats is not None:
+            _scopes.set(tuple(scope for scope in _scopes.get() if scope is not stats))
+            if logger is not None:
+                logger.info('%s %r', request.path, stats.report())
+
+
+def _do_orm_execute(state):
+    if not _scopes.get():
+        return
+    path = state.loader_strategy_path.path if state.loader_strategy_path is not None else ()
+    if state.is_relationship_load and len(path) >= 2:
+        kind = 'lazy load' if state.lazy_loaded_from is not None else 'eager load'
+        label = '%s.%s %s' % (path[-2].class_.__name__, path[-1].key, kind)
+    elif state.bind_mapper is not None:
+        label = '%s %s' % (state.bind_mapper.class_.__name__, 'select' if state.is_select else 'execute')
+    else:
+        label = None
+    _label.set(label)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _scopes.get():
+        conn.info.setdefault('kiero_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    scopes = _scopes.get()
+    if not scopes:
+        return
+    starts = conn.info.get('kiero_query_start')
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    label = _label.get()
+    if label is not None:
+        _label.set(None)
+    else:
+        label = _statement_label(statement)
+    for stats in scopes:
+        stats.add(label, duration, statement)
+
+
+def _statement_label(statement):
+    verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else 'sql'
+    match = _TABLE.search(statement)
+    return '%s %s' % (match.group(1), verb) if match else verb
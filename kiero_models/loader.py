@@ -0,0 +1,102 @@
+# coding: utf-8
+"""Lightweight entry point for workers: no Flask, only the groups you need.
+
+    from kiero_models import loader
+    models = loader.load('chat')    # users, catalog and chat
+    models['Message'], models['ChatRoom']
+    loader.configure()              # optional, otherwise on the first query
+    loader.report()                 # {'import': {'base': ..., 'users': ...}, 'configure': ..., 'mappers': 37}
+
+    python -m kiero_models.loader chat orders
+
+Mapper configuration (resolving the string primaryjoins and backrefs) is
+left to SQLAlchemy, which runs it on first use; call configure() to pay it
+at a chosen moment, e.g. before forking, and to have it timed.
+"""
+import importlib
+import json
+import sys
+import time
+
+GROUPS = ('users', 'catalog', 'orders', 'chat')
+DEPENDENCIES = {
+    'users': (),
+    'catalog': ('users',),
+    'orders': ('users', 'catalog'),
+    'chat': ('users', 'catalog'),
+}
+
+_import_times = {}
+_configure_time = None
+
+
+def resolve(groups):
+    """`groups` plus their dependencies, in load order."""
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        raise ValueError('unknown model group(s): %s' % ', '.join(sorted(unknown)))
+    wanted = set(groups)
+    for group in groups:
+        wanted.update(DEPENDENCIES[group])
+    return [group for group in GROUPS if group in wanted]
+
+
+def load(*groups):
+    """Import the given groups (all of them when none are given) and return {class name: model}."""
+    _timed_import('base')
+    for group in resolve(groups or GROUPS):
+        _timed_import(group)
+    return loaded_models()
+
+
+def loaded_models():
+    base = sys.modules.get(__package__ + '.base')
+    if base is None:
+        return {}
+    return {mapper.class_.__name__: mapper.class_ for mapper in base.Base.registry.mappers}
+
+
+def configure():
+    """Configure the loaded mappers now; returns the time it took in seconds."""
+    global _configure_time
+    from sqlalchemy.orm import configure_mappers
+    started = time.perf_counter()
+    configure_mappers()
+    _configure_time = time.perf_counter() - started
+    return _configure_time
+
+
+def report():
+    return {
+        'import': dict(_import_times),
+        'import_total': sum(_import_times.values()),
+        'configure': _configure_time,
+        'groups': [group for group in GROUPS if group in _import_times],
+        'mappers': len(loaded_models()),
+        'flask_loaded': 'flask' in sys.modules,
+    }
+
+
+def _timed_import(name):
+    module = __package__ + '.' + name
+    if module in sys.modules:
+        _import_times.setdefault(name, 0.0)
+        return sys.modules[module]
+    started = time.perf_counter()
+    mod = importlib.import_module(module)
+    _import_times[name] = time.perf_counter() - started
+    return mod
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    groups = [arg for arg in argv if not arg.startswith('--')]
+    load(*groups)
+    if '--no-configure' not in argv:
+        configure()
+    print(json.dumps(report(), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# coding: utf-8
+"""Money column type: MONEY on Postgres, NUMERIC(18, 2) elsewhere, read as numbers.
+
+Postgres sends MONEY values as locale-formatted strings ('$1,234.56');
+Money columns are selected as money::numeric instead, so the driver hands
+back a Decimal and nothing parses a string. Bound values are cast to money
+the same way, which also makes comparisons with numbers valid SQL.
+
+    price = Column(Money, nullable=False)        # Decimal('1234.56')
+    price = Column(Money(cents=True))            # 123456
+
+Read from Postgres the Decimal is a MoneyAmount, whose str() is the text
+the driver used to return ('$1,234.56', '-$5.00'), so json() output does
+not change; arithmetic on it gives plain Decimals.
+
+as_numeric() and as_money() do the same casts inside expressions; MONEY
+arithmetic on Postgres only accepts integer and float operands, so compute
+on as_numeric(column) and assign the result through as_money().
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import Numeric
+from sqlalchemy.dialects.postgresql.base import MONEY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import TypeDecorator
+
+CENT = Decimal('0.01')
+
+
+def to_cents(value):
+    """Integer cents of a Decimal, int or float amount, rounded half up; None stays None."""
+    if value is None:
+        return None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2) if cents is not None else None
+
+
+class MoneyAmount(Decimal):
+    """Decimal whose str() is Postgres money output in the C / en_US locale."""
+    __slots__ = ()
+
+    def __str__(self):
+        return '%s$%s' % ('-' if self < 0 else '', format(abs(self), ',.2f'))
+
+
+class as_numeric(FunctionElement):
+    """`expr` as NUMERIC on Postgres; unchanged on the other databases."""
+    type = Numeric(18, 2)
+    name = 'as_numeric'
+    inherit_cache = True
+
+
+class as_money(FunctionElement):
+    """`expr` as MONEY on Postgres; unchanged on the other databases."""
+    type = Numeric(18, 2)
+    name = 'as_money'
+    inherit_cache = True
+
+
+@compiles(as_numeric)
+@compiles(as_money)
+def _passthrough(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+
+@compiles(as_numeric, 'postgresql')
+def _numeric_postgresql(element, compiler, **kw):
+    return 'CAST(%s AS NUMERIC)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(as_money, 'postgresql')
+def _money_postgresql(element, compiler, **kw):
+    return 'CAST(%s AS MONEY)' % compiler.process(element.clauses, **kw)
+
+
+class Money(TypeDecorator):
+    impl = Numeric(18, 2)
+    cache_ok = True
+
+    def __init__(self, cents=False):
+        super(Money, self).__init__()
+        self.cents = cents
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(MONEY())
+        return dialect.type_descriptor(Numeric(18, 2))
+
+    def column_expression(self, column):
+        return as_numeric(column)
+
+    def bind_expression(self, bindvalue):
+        return as_money(bindvalue)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if self.cents:
+            value = from_cents(value)
+        elif not isinstance(value, Decimal):
+            value = Decimal(str(value))
+        # Postgres numeric -> money and SQLite both take the plain number
+        return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if self.cents:
+            return to_cents(value)
+        value = Decimal(str(value)).quantize(CENT)
+        return MoneyAmount(value) if dialect.name == 'postgresql' else value
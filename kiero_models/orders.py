@@ -0,0 +1,102 @@
+# coding: utf-8
+"""Orders, payment methods and PayU transactions."""
+import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, Numeric, SmallInteger, String, \
+    Text, JSON, Index, func
+from sqlalchemy.schema import FetchedValue
+from sqlalchemy.orm import relationship
+
+from . import catalog  # noqa: F401, orders reference products
+from .base import Base, DBUtils
+from .users import User
+
+
+class Order(Base, DBUtils):
+    __tablename__ = 'orders'
+    __table_args__ = (
+        Index('ix_orders_user_id_status', 'user_id', 'status'),
+        Index('ix_orders_seller_id_created_since', 'seller_id', 'created_since'),
+    )
+    # fetch the updated_since set by onupdate in the UPDATE itself, instead of expiring it
+    __mapper_args__ = {'eager_defaults': True}
+
+    order_id = Column(BigInteger, primary_key=True, server_default=FetchedValue())
+    product_id = Column(ForeignKey('products.product_id'), nullable=False, index=True)
+    user_id = Column(ForeignKey('users.user_id'), nullable=False)
+    seller_id = Column(ForeignKey('users.user_id'), nullable=False)
+    method_id = Column(ForeignKey('payment_methods.method_id'), nullable=False)
+    transaction_id = Column(Integer)
+    quantity = Column(Integer, server_default=FetchedValue())
+    total = Column(Numeric(18, 2))
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    # on the database clock, like created_since; SalesCache refreshes from it
+    updated_since = Column(DateTime, onupdate=func.now())
+
+    method = relationship('PaymentMethod', primaryjoin='Order.method_id == PaymentMethod.method_id',
+                          backref='orders')
+    product = relationship('Product', foreign_keys=product_id)
+    user = relationship('User', primaryjoin='Order.user_id == User.user_id', backref='orders')
+    # seller = relationship('User', primaryjoin='Order.seller_id == User.user_id', backref='orders')
+    users_qualify = relationship('User', secondary='qualifies_order_store')
+    purchase_status = Column(Integer, nullable=True, server_default='1')
+
+
+class PaymentMethod(Base, DBUtils):
+    __tablename__ = 'payment_methods'
+
+    method_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    name = Column(String(50), nullable=False)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+
+class TransactionsPayu(Base, DBUtils):
+    __tablename__ = 'transactions_payu'
+
+    transaction_id = Column(Integer, primary_key=True, unique=True, server_default=FetchedValue())
+    order_id_payu = Column(String(50), nullable=False)
+    transaction_id_payu = Column(String(50), nullable=False)
+    code_response_payu = Column(String(50))
+    state_transaction = Column(String(50))
+    trazability_code = Column(String(50))
+    operation_payu_date = Column(DateTime)
+    order_id = Column(ForeignKey('orders.order_id'), nullable=False, index=True)
+    state = Column(String(50))
+    transaction_state = Column(String(50))
+    pol_response_code = Column(String(50))
+    lap_response_code = Column(String(50))
+    lap_transaction_state = Column(String(50))
+    msg_payu = Column(String(255))
+    ref_code = Column(String(50))
+
+    order = relationship('Order')
+
+
+class QualifyOrderStore(Base, DBUtils):
+    __tablename__ = 'qualifies_order_store'
+
+    qualify_order_store_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey('orders.order_id'), primary_key=True, index=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+    value = Column(Integer)
+
+
+class RatePurchase(Base, DBUtils):
+    __tablename__ = 'rate_purchase'
+
+    rate_purchase_id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(Integer, ForeignKey('orders.order_id'), index=True)
+    rate_purchase = Column(Integer)
+    rate_product = Column(Integer)
+    comments = Column(Text, nullable=True)
+    images = Column(JSON)
+    created_since = Column(DateTime,  default=datetime.datetime.utcnow)
+
+
+# User relationships into this group, added here so the users group loads on its own
+User.orders_qualify = relationship('Order', secondary='qualifies_order_store')
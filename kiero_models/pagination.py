@@ -0,0 +1,106 @@
+# coding: utf-8
+"""Keyset (cursor) pagination for append-heavy timelines.
+
+Pages are read newest first by seeking on (creation time, primary key)
+instead of OFFSET, so page 1000 costs the same as page 1 given an index on
+the filter columns followed by the keyset columns. Cursors are opaque,
+URL-safe strings.
+
+    page = Message.keyset_page(Message.query.filter(Message.room_id == room_id), per_page=50)
+    older = Message.keyset_page(query, per_page=50, after=page.next_cursor)
+    newer = Message.keyset_page(query, per_page=50, before=older.prev_cursor)
+"""
+import base64
+import datetime
+import json
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([val.isoformat() if isinstance(val, datetime.datetime) else val for val in values],
+                     separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created, ident = json.loads(raw.decode('utf-8'))
+        return datetime.datetime.fromisoformat(created), ident
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(str(exc))
+
+
+class KeysetPage(object):
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def json(self, *args):
+        return {
+            'items': [item.json(*args) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+        }
+
+
+class KeysetPaginated(object):
+    # (creation time attribute, primary key attribute), newest first
+    __keyset__ = ('created_since', None)
+
+    @classmethod
+    def keyset_columns(cls):
+        created, ident = cls.__keyset__
+        return getattr(cls, created), getattr(cls, ident)
+
+    @classmethod
+    def keyset_page(cls, query, per_page=20, after=None, before=None, session=None):
+        """One page of `query` (a Query, or a select() with `session`).
+
+        `after` continues towards older rows from a page's next_cursor,
+        `before` goes back towards newer rows from a page's prev_cursor.
+        Rows with a NULL creation time are never returned.
+        """
+        created, ident = cls.keyset_columns()
+        key = tuple_(created, ident)
+        stmt = query.filter(created.isnot(None)).order_by(None)
+        if before is not None:
+            stmt = stmt.filter(key > tuple_(*decode_cursor(before))).order_by(created.asc(), ident.asc())
+        else:
+            if after is not None:
+                stmt = stmt.filter(key < tuple_(*decode_cursor(after)))
+            stmt = stmt.order_by(created.desc(), ident.desc())
+        stmt = stmt.limit(per_page + 1)
+        rows = stmt.all() if isinstance(query, Query) else session.scalars(stmt).all()
+
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if before is not None:
+            rows.reverse()
+        if not rows:
+            return KeysetPage([], None, None)
+        first = encode_cursor(cls._keyset_values(rows[0]))
+        last = encode_cursor(cls._keyset_values(rows[-1]))
+        if before is not None:
+            return KeysetPage(rows, last, first if more else None)
+        return KeysetPage(rows, last if more else None, first if after is not None else None)
+
+    @classmethod
+    def _keyset_values(cls, row):
+        created, ident = cls.__keyset__
+        return getattr(row, created), getattr(row, ident)
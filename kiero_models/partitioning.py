@@ -0,0 +1,366 @@
+# coding: utf-8
+"""Monthly range partitions for the append-only tables, with archiving.
+
+Models opt in with `__partition__ = '<creation time column>'` (AuditLog,
+Message and Notifications). Partitions are named <table>_pYYYY_MM.
+
+On Postgres the table becomes a native RANGE-partitioned parent: convert()
+migrates an existing table once, ensure_partitions() creates the coming
+months, and the planner prunes partitions whenever a query bounds the
+creation time, which range_select() always does. On SQLite, for tests, the
+mapped table holds the current rows and detach() moves closed months into
+per-period tables; range_select() unions the main table with the periods
+that overlap the bounds, so the other periods are not read.
+
+    partitioning.ensure_partitions(conn, Message, ahead=3)
+    partitioning.archive(conn, Message, before=datetime(2025, 1, 1), directory='/var/archive')
+    messages = session.scalars(partitioning.range_select(
+        session, Message, start, end, Message.room_id == room_id,
+        order_by=Message.created_since.desc(), limit=50)).all()
+
+    python -m kiero_models.partitioning DATABASE_URL maintain --archive-dir /var/archive
+
+archive() writes each old partition to <directory>/<partition>.ndjson.gz
+(rows shaped like model.json()) and drops it.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import sys
+
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, func, inspect, select, text, union_all
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql import visitors
+
+from .chat import Message
+from .serializer import to_json_value
+from .upsert import connection_for
+from .users import AuditLog, Notifications
+
+MODELS = (AuditLog, Message, Notifications)
+# months kept online by maintain(); older partitions are archived
+RETENTION_MONTHS = {'audit_logs': 12, 'messages': 24, 'notifications': 6}
+CHUNK_SIZE = 1000
+
+
+def add_months(value, months):
+    """First day of the month `months` after the month of `value`."""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def month_start(value):
+    return add_months(value, 0)
+
+
+def partition_name(table_name, month):
+    return '%s_p%04d_%02d' % (table_name, month.year, month.month)
+
+
+def period_tables(bind, model):
+    """(month, name) of every partition or period table of `model` in the database, oldest first."""
+    conn = connection_for(bind)
+    pattern = re.compile(r'^%s_p(\d{4})_(\d{2})$' % re.escape(model.__table__.name))
+    tables = []
+    for name in inspect(conn).get_table_names():
+        match = pattern.match(name)
+        if match:
+            tables.append((datetime.datetime(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(tables)
+
+
+def attached_partitions(bind, model):
+    """Names of the partitions attached to the Postgres parent of `model`."""
+    conn = connection_for(bind)
+    return set(conn.execute(text(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :parent'),
+        {'parent': model.__table__.name}).scalars())
+
+
+def period_table(model, name):
+    """A Table with the columns of `model` named `name`, indexed on the partition column."""
+    columns = [Column(col.name, col.type, primary_key=col.primary_key, nullable=col.nullable)
+               for col in model.__table__.columns]
+    table = Table(name, MetaData(), *columns)
+    Index('ix_%s_%s' % (name, model.__partition__), table.c[model.__partition__])
+    return table
+
+
+def ensure_partitions(bind, model, ahead=3, start=None):
+    """Create the partitions from the month of `start` (default now) to `ahead` months later; returns new names."""
+    conn = connection_for(bind)
+    first = month_start(start or datetime.datetime.utcnow())
+    existing = set(name for _, name in period_tables(conn, model))
+    created = []
+    for offset in range(ahead + 1):
+        month = add_months(first, offset)
+        name = partition_name(model.__table__.name, month)
+        if name in existing:
+            continue
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("CREATE TABLE %s PARTITION OF %s FOR VALUES FROM ('%s') TO ('%s')"
+                              % (name, model.__table__.name, month.isoformat(), add_months(month, 1).isoformat())))
+        else:
+            period_table(model, name).create(conn)
+        created.append(name)
+    return created
+
+
+def convert(bind, model, ahead=3):
+    """Turn the existing Postgres table of `model` into a partitioned parent; returns the rows copied.
+
+    The old table stays as <table>_unpartitioned, with its indexes renamed
+    the same way, for checking and dropping by hand. The parent copies the
+    defaults, check constraints, identities and comments of the old table,
+    its foreign keys, the indexes declared on the model and the other plain
+    column indexes of the old table. The primary key gains the partition
+    column, as Postgres requires (the mapped primary key is unchanged); other
+    unique indexes are not carried over for the same reason, and foreign keys
+    from other tables keep pointing at <table>_unpartitioned. Rows outside
+    every monthly partition (including those with no creation time, stored as
+    1970-01-01) go to <table>_default.
+    """
+    conn = connection_for(bind)
+    if conn.dialect.name != 'postgresql':
+        raise ValueError('convert() needs Postgres, not %s' % conn.dialect.name)
+    table = model.__table__
+    column = model.__partition__
+    legacy = table.name + '_unpartitioned'
+    insp = inspect(conn)
+    old_indexes = insp.get_indexes(table.name)
+    foreign_keys = insp.get_foreign_keys(table.name)
+    renamed = [index['name'] for index in old_indexes] + [insp.get_pk_constraint(table.name)['name']]
+    conn.execute(text('ALTER TABLE %s RENAME TO %s' % (table.name, legacy)))
+    for name in renamed:
+        if name:
+            conn.execute(text('ALTER INDEX %s RENAME TO %s_unpartitioned' % (name, name)))
+
+    keys = [col.name for col in table.primary_key.columns if col.name != column] + [column]
+    # the old primary key and unique indexes lack the partition column, which Postgres refuses
+    conn.execute(text('CREATE TABLE %s (LIKE %s INCLUDING ALL EXCLUDING INDEXES) PARTITION BY RANGE (%s)'
+                      % (table.name, legacy, column)))
+    conn.execute(text('ALTER TABLE %s ADD PRIMARY KEY (%s)' % (table.name, ', '.join(keys))))
+    declared = set(index.name for index in table.indexes)
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    for index in old_indexes:
+        if index['name'] not in declared and not index['unique'] and None not in index['column_names']:
+            conn.execute(text('CREATE INDEX %s ON %s (%s)'
+                              % (index['name'], table.name, ', '.join(index['column_names']))))
+    for foreign_key in foreign_keys:
+        conn.execute(text(_foreign_key_ddl(table.name, foreign_key)))
+    conn.execute(text('CREATE TABLE %s_default PARTITION OF %s DEFAULT' % (table.name, table.name)))
+
+    now = datetime.datetime.utcnow()
+    oldest = conn.execute(text('SELECT min(%s) FROM %s' % (column, legacy))).scalar() or now
+    months = (now.year - oldest.year) * 12 + now.month - oldest.month
+    ensure_partitions(conn, model, ahead=months + ahead, start=oldest)
+
+    names = [col.name for col in table.columns]
+    values = ["coalesce(%s, '1970-01-01')" % name if name == column else name for name in names]
+    copied = conn.execute(text('INSERT INTO %s (%s) SELECT %s FROM %s'
+                               % (table.name, ', '.join(names), ', '.join(values), legacy))).rowcount
+    for name in keys:
+        sequence = conn.execute(select(func.pg_get_serial_sequence(legacy, name))).scalar()
+        if sequence:
+            conn.execute(text('ALTER SEQUENCE %s OWNED BY %s.%s' % (sequence, table.name, name)))
+    return copied
+
+
+def _foreign_key_ddl(table_name, foreign_key):
+    """ALTER TABLE ... ADD CONSTRAINT for a foreign key as reflected by Inspector.get_foreign_keys()."""
+    referred = foreign_key['referred_table']
+    if foreign_key.get('referred_schema'):
+        referred = '%s.%s' % (foreign_key['referred_schema'], referred)
+    ddl = 'ALTER TABLE %s ADD %sFOREIGN KEY (%s) REFERENCES %s (%s)' % (
+        table_name, 'CONSTRAINT %s ' % foreign_key['name'] if foreign_key.get('name') else '',
+        ', '.join(foreign_key['constrained_columns']), referred, ', '.join(foreign_key['referred_columns']))
+    options = foreign_key.get('options') or {}
+    if options.get('onupdate'):
+        ddl += ' ON UPDATE %s' % options['onupdate']
+    if options.get('ondelete'):
+        ddl += ' ON DELETE %s' % options['ondelete']
+    if options.get('deferrable'):
+        ddl += ' DEFERRABLE'
+    if options.get('initially'):
+        ddl += ' INITIALLY %s' % options['initially']
+    return ddl
+
+
+def detach(bind, model, before):
+    """Take the months before the month of `before` out of the live table; returns their names.
+
+    On Postgres the partitions are detached; on SQLite the rows of those
+    months move from the main table into their period tables.
+    """
+    conn = connection_for(bind)
+    cutoff = month_start(before)
+    if conn.dialect.name == 'postgresql':
+        attached = attached_partitions(conn, model)
+        names = [name for month, name in period_tables(conn, model) if month < cutoff and name in attached]
+        for name in names:
+            conn.execute(text('ALTER TABLE %s DETACH PARTITION %s' % (model.__table__.name, name)))
+        return names
+    return _move_to_periods(conn, model, cutoff)
+
+
+def _move_to_periods(conn, model, cutoff):
+    table = model.__table__
+    column = table.c[model.__partition__]
+    oldest = conn.execute(select(func.min(column))).scalar()
+    if oldest is None:
+        return []
+    if isinstance(oldest, str):
+        oldest = datetime.datetime.fromisoformat(oldest)
+    existing = set(name for _, name in period_tables(conn, model))
+    moved = []
+    month = month_start(oldest)
+    while month < cutoff:
+        name = partition_name(table.name, month)
+        target = period_table(model, name)
+        if name not in existing:
+            target.create(conn)
+        in_month = (column >= month) & (column < add_months(month, 1))
+        rows = conn.execute(target.insert().from_select([col.name for col in table.columns],
+                                                        select(*table.columns).where(in_month))).rowcount
+        conn.execute(table.delete().where(in_month))
+        if rows:
+            moved.append(name)
+        month = add_months(month, 1)
+    return moved
+
+
+def archive(bind, model, before, directory):
+    """Detach the months before the month of `before`, write each to a gzipped NDJSON file and drop it.
+
+    Returns [(path, rows)]. Files are written next to their final name and
+    renamed once complete, so a partition is dropped only after its archive
+    is on disk.
+    """
+    conn = connection_for(bind)
+    cutoff = month_start(before)
+    detach(conn, model, before)
+    attached = attached_partitions(conn, model) if conn.dialect.name == 'postgresql' else set()
+    archived = []
+    for month, name in period_tables(conn, model):
+        if month >= cutoff or name in attached:
+            continue
+        path = os.path.join(directory, name + '.ndjson.gz')
+        rows = _write_archive(conn, period_table(model, name), path)
+        conn.execute(text('DROP TABLE %s' % name))
+        archived.append((path, rows))
+    return archived
+
+
+def _write_archive(conn, table, path):
+    names = [col.name for col in table.columns]
+    stmt = select(*table.columns).order_by(*table.primary_key.columns) \
+        .execution_options(stream_results=True, yield_per=CHUNK_SIZE)
+    partial = path + '.partial'
+    count = 0
+    with gzip.open(partial, 'wt', encoding='utf-8') as fh:
+        for rows in conn.execute(stmt).partitions(CHUNK_SIZE):
+            fh.write(''.join(json.dumps({name: to_json_value(value) for name, value in zip(names, row)},
+                                        separators=(',', ':')) + '\n' for row in rows))
+            count += len(rows)
+    with open(partial, 'rb') as fh:
+        os.fsync(fh.fileno())
+    os.replace(partial, path)
+    return count
+
+
+def range_select(bind, model, start=None, end=None, *criteria, order_by=(), limit=None):
+    """select(model) of the rows created in [start, end) that match `criteria`, reading only the partitions in range.
+
+    `criteria` and `order_by` (one clause or a sequence) are written against
+    `model` and `limit` caps the rows; pass them here rather than calling
+    .where(), .order_by() or .limit() on the result. On Postgres the result
+    selects from the model's table, but on SQLite it may select from a union
+    of the live and period tables, which columns of `model` do not name.
+    """
+    conn = connection_for(bind)
+    column = model.__partition__
+
+    def bounded(table):
+        where = [_on_table(criterion, model.__table__, table) for criterion in criteria]
+        if start is not None:
+            where.append(table.c[column] >= start)
+        if end is not None:
+            where.append(table.c[column] < end)
+        return where
+
+    periods = [] if conn.dialect.name == 'postgresql' else [
+        period_table(model, name) for month, name in period_tables(conn, model)
+        if (end is None or month < end) and (start is None or add_months(month, 1) > start)]
+    if not isinstance(order_by, (list, tuple)):
+        order_by = [order_by]
+    if not periods:
+        stmt = select(model).where(*bounded(model.__table__)).order_by(*order_by)
+    else:
+        rows = union_all(*[select(*table.columns).where(*bounded(table)) for table in [model.__table__] + periods])
+        rows = rows.subquery(model.__table__.name + '_range')
+        stmt = select(aliased(model, rows)) \
+            .order_by(*[_on_table(clause, model.__table__, rows) for clause in order_by])
+    return stmt.limit(limit) if limit is not None else stmt
+
+
+def _on_table(criterion, source, table):
+    """`criterion` with the columns of `source` replaced by the same-named columns of `table`."""
+    if table is source:
+        return criterion
+    if hasattr(criterion, '__clause_element__'):
+        criterion = criterion.__clause_element__()
+
+    def replace(element):
+        if getattr(element, 'table', None) is source and getattr(element, 'name', None) in table.c:
+            return table.c[element.name]
+        return None
+
+    return visitors.replacement_traverse(criterion, {}, replace)
+
+
+def maintain(bind, directory, ahead=3, retention=None, now=None):
+    """Create the coming partitions of every partitioned model and archive the expired ones."""
+    conn = connection_for(bind)
+    retention = dict(RETENTION_MONTHS, **(retention or {}))
+    now = now or datetime.datetime.utcnow()
+    report = {}
+    for model in MODELS:
+        name = model.__table__.name
+        created = ensure_partitions(conn, model, ahead=ahead, start=now)
+        archived = archive(conn, model, add_months(now, -retention[name]), directory)
+        report[name] = {'created': created, 'archived': archived}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the monthly partitions of the append-only tables.')
+    parser.add_argument('url')
+    sub = parser.add_subparsers(dest='command', required=True)
+    maintain_parser = sub.add_parser('maintain', help='create coming partitions and archive expired ones')
+    maintain_parser.add_argument('--archive-dir', required=True)
+    maintain_parser.add_argument('--ahead', type=int, default=3)
+    maintain_parser.add_argument('--keep', action='append', default=[], metavar='TABLE=MONTHS')
+    convert_parser = sub.add_parser('convert', help='partition an existing Postgres table')
+    convert_parser.add_argument('table', choices=[model.__table__.name for model in MODELS])
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.url)
+    with engine.begin() as conn:
+        if args.command == 'maintain':
+            retention = dict((table, int(months)) for table, months in (keep.split('=', 1) for keep in args.keep))
+            report = maintain(conn, args.archive_dir, ahead=args.ahead, retention=retention)
+        else:
+            model = [model for model in MODELS if model.__table__.name == args.table][0]
+            report = {args.table: {'copied': convert(conn, model)}}
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
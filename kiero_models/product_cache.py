@@ -0,0 +1,335 @@
+# coding: utf-8
+"""Versioned cache of the serialized product detail document.
+
+The document is product.json(*DOCUMENT): images, category, store,
+questions with their answers, product_details and the product's
+ProductGlobal rows with variants and images, loaded in a few selectin
+queries and stored as a JSON string. Entries carry a version, a digest of
+the count, highest key and latest created/updated time of the product row
+and each child table, computed by one indexed query.
+
+    cache = ProductDocumentCache(LRUBackend(max_bytes=64 * 1024 * 1024)).install()
+    document = cache.get(session, product_id)      # dict, or None for a missing product
+    body = cache.get_json(session, product_id)     # the cached JSON string as is
+
+install() drops a product's entry after any commit or rollback of a
+transaction that inserted, updated or deleted the product or one of its
+child rows through the ORM. A session with writes in its open transaction
+(flushed or not) gets its documents built from its own state and never
+stored, so uncommitted data does not reach the cache. With
+verify=True (the default) every hit also compares the stored version with
+the database at the cost of that one query. That catches rows inserted or
+deleted by any means, and rows updated through SQLAlchemy, ORM or Core, as
+updated_since has an onupdate; it misses raw SQL updates that leave
+updated_since alone, and updates of products_global and its variants, which
+have no timestamp, made without the ORM. verify=False trusts the events and
+serves hits without querying.
+
+Only one worker rebuilds a missing or outdated document: it takes a lock
+with the backend's add(); the others serve the outdated document meanwhile,
+or wait up to `lock_timeout` for the new one when there is none. Backends
+implement get/set/add/delete like a memcached or Redis client:
+LRUBackend is process-local, FileBackend shares entries between the
+processes of one machine through a directory.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from .catalog import (Answer, File, FileGlobal, Product, ProductDetails, ProductGlobal, ProductVariant,
+                      Question)
+from .serializer import loader_options
+
+DOCUMENT = ('images', 'category', 'store', 'questions.answers', 'product_details',
+            'product_global_products.product_variants', 'product_global_products.images')
+# child tables whose rows are part of the document, and how each reaches products.product_id
+_CHILDREN = (
+    (File, lambda product_id: File.product_id == product_id),
+    (Question, lambda product_id: Question.product_id == product_id),
+    (Answer, lambda product_id: Answer.question_id.in_(
+        select(Question.question_id).where(Question.product_id == product_id))),
+    (ProductDetails, lambda product_id: ProductDetails.product_id == product_id),
+    (ProductGlobal, lambda product_id: ProductGlobal.product_id == product_id),
+    (ProductVariant, lambda product_id: ProductVariant.product_global_id.in_(
+        select(ProductGlobal.product_global_id).where(ProductGlobal.product_id == product_id))),
+    (FileGlobal, lambda product_id: FileGlobal.product_global_id.in_(
+        select(ProductGlobal.product_global_id).where(ProductGlobal.product_id == product_id))),
+)
+_PENDING = 'product_cache_pending'
+_WROTE = 'product_cache_wrote'
+
+
+class LRUBackend(object):
+    """In-process store bounded by entry count and total bytes of the values."""
+
+    def __init__(self, maxsize=10000, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        """Set `key` only if it is absent or expired; returns whether it was set."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] >= time.time()):
+                return False
+            self._put(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _put(self, key, value, ttl):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.time() + ttl if ttl else None, value)
+        self.bytes += len(value)
+        while self._entries and (len(self._entries) > self.maxsize
+                                 or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self.bytes -= len(self._entries.pop(key)[1])
+
+
+class FileBackend(object):
+    """Entries as files in `directory`, shared by the processes of one machine.
+
+    Writes go through a temporary file and a rename; add() relies on
+    O_CREAT | O_EXCL, so exactly one process wins a lock.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as fh:
+                expires, value = fh.read().split('\n', 1)
+        except (IOError, ValueError):
+            return None
+        if expires and float(expires) < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        fd, partial = tempfile.mkstemp(dir=self.directory, prefix='.partial-')
+        with os.fdopen(fd, 'w') as fh:
+            fh.write('%s\n%s' % (time.time() + ttl if ttl else '', value))
+        os.replace(partial, self._path(key))
+
+    def add(self, key, value, ttl=None):
+        if self.get(key) is not None:
+            return False
+        try:
+            fd = os.open(self._path(key), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # an expired entry get() did not remove yet, or a concurrent add()
+            return False
+        with os.fdopen(fd, 'w') as fh:
+            fh.write('%s\n%s' % (time.time() + ttl if ttl else '', value))
+        return True
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def document_version(bind, product_id):
+    """Digest of the product row and its child rows, in one query; None if the product does not exist."""
+    columns = [Product.updated_since, Product.created_since]
+    for model, criteria in _CHILDREN:
+        aggregates = [func.count(), func.max(inspect(model).primary_key[0])]
+        changed = [getattr(model, name) for name in ('updated_since', 'created_since') if hasattr(model, name)]
+        if changed:
+            aggregates.append(func.max(func.coalesce(*changed) if len(changed) > 1 else changed[0]))
+        columns.extend(select(aggregate).where(criteria(product_id)).scalar_subquery() for aggregate in aggregates)
+    row = bind.execute(select(*columns).where(Product.product_id == product_id)).first()
+    if row is None:
+        return None
+    return hashlib.sha1(repr(tuple(row)).encode('utf-8')).hexdigest()
+
+
+class ProductDocumentCache(object):
+    def __init__(self, backend=None, ttl=3600, verify=True, lock_timeout=5.0, paths=DOCUMENT, prefix='product-doc'):
+        self.backend = backend if backend is not None else LRUBackend()
+        self.ttl = ttl
+        self.verify = verify
+        self.lock_timeout = lock_timeout
+        self.paths = tuple(paths)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.rebuilds = 0
+        self._installed = False
+
+    def get(self, session, product_id):
+        body = self.get_json(session, product_id)
+        return json.loads(body) if body is not None else None
+
+    def get_json(self, session, product_id):
+        if session.info.get(_WROTE) or session.new or session.deleted or session.dirty:
+            # this transaction's own changes: build, but leave the shared entry alone
+            self.misses += 1
+            return self._build(session, product_id, None)[1]
+        key = self._key(product_id)
+        entry = self._read(key)
+        if entry is not None and not self.verify:
+            self.hits += 1
+            return entry[1]
+        version = document_version(session, product_id)
+        if version is None:
+            return None
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        lock = key + ':lock'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.backend.add(lock, token, ttl=max(1, int(self.lock_timeout * 2))):
+            if entry is not None:
+                # someone else is rebuilding; the outdated document will do meanwhile
+                self.stale += 1
+                return entry[1]
+            if time.monotonic() >= deadline:
+                return self._build(session, product_id, version)[1]
+            time.sleep(0.01)
+            entry = self._read(key)
+            if entry is not None and (not self.verify or entry[0] == version):
+                self.hits += 1
+                return entry[1]
+        try:
+            # the previous lock holder may have stored this very version meanwhile
+            entry = self._read(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            version, body = self._build(session, product_id, version)
+            if body is not None:
+                self.backend.set(key, '%s\n%s' % (version, body), ttl=self.ttl)
+            return body
+        finally:
+            if self.backend.get(lock) == token:
+                self.backend.delete(lock)
+
+    def invalidate(self, *product_ids):
+        for product_id in product_ids:
+            self.backend.delete(self._key(product_id))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale, 'rebuilds': self.rebuilds}
+
+    def install(self):
+        if not self._installed:
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_soft_rollback', self._after_rollback)
+            self._installed = True
+        return self
+
+    def uninstall(self):
+        if self._installed:
+            event.remove(Session, 'after_flush', self._after_flush)
+            event.remove(Session, 'after_commit', self._after_commit)
+            event.remove(Session, 'after_soft_rollback', self._after_rollback)
+            self._installed = False
+
+    def _key(self, product_id):
+        return '%s:%s' % (self.prefix, product_id)
+
+    def _read(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        return value.split('\n', 1)
+
+    def _build(self, session, product_id, version):
+        # the version is read before the rows, so a concurrent change makes it outdated, never newer;
+        # a document built for a version is refreshed from the database, not from the identity map,
+        # whose objects may predate that version. Without a version it is the session's own view.
+        self.rebuilds += 1
+        product = session.get(Product, product_id, options=loader_options(Product, *self.paths),
+                              populate_existing=version is not None)
+        if product is None:
+            return version, None
+        return version, json.dumps(product.json(*self.paths), separators=(',', ':'))
+
+    def _after_flush(self, session, context):
+        if session.new or session.dirty or session.deleted:
+            session.info[_WROTE] = True
+        pending = session.info.setdefault(_PENDING, set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            pending.update(_product_ids(session, obj))
+        pending.discard(None)
+
+    def _after_commit(self, session):
+        session.info.pop(_WROTE, None)
+        pending = session.info.pop(_PENDING, None)
+        if pending:
+            self.invalidate(*pending)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(_WROTE, None)
+            pending = session.info.pop(_PENDING, None)
+            if pending:
+                self.invalidate(*pending)
+
+
+def _values(obj, name):
+    """Current and previous values of a column attribute, without loading it."""
+    state = inspect(obj)
+    history = state.attrs[name].history
+    return set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ()) or \
+        set([state.dict.get(name)])
+
+
+def _product_ids(session, obj):
+    if isinstance(obj, (Product, File, Question, ProductDetails, ProductGlobal)):
+        return _values(obj, 'product_id')
+    if isinstance(obj, Answer):
+        question_ids = _values(obj, 'question_id') - set([None])
+        return set(session.execute(select(Question.product_id).where(Question.question_id.in_(question_ids)))
+                   .scalars()) if question_ids else set()
+    if isinstance(obj, (ProductVariant, FileGlobal)):
+        global_ids = _values(obj, 'product_global_id') - set([None])
+        return set(session.execute(select(ProductGlobal.product_id)
+                                   .where(ProductGlobal.product_global_id.in_(global_ids))).scalars()) \
+            if global_ids else set()
+    return set()
@@ -0,0 +1,143 @@
+# coding: utf-8
+"""Read-only projections for listing pages.
+
+A projection selects a handful of columns with Core and wraps each row in a
+tuple subclass: no identity map, no instrumentation, none of the Text
+columns a listing never shows. Fields read like attributes and json()
+returns the same keys and values as the model's json() for those columns:
+
+    cards = ProductCard.load(session, Product.category_id == 12,
+                             order_by=Product.product_id.desc(), limit=50)
+    [card.json() for card in cards]   # {'product_id': ..., 'title': ..., 'main_image': ...}
+
+    stmt = ProductCard.select(Product.store_id == store_id).order_by(Product.price)
+    cards = ProductCard.from_result(session.execute(stmt))
+"""
+from operator import itemgetter
+
+from sqlalchemy import func, select
+
+from .catalog import Category, File, FileGlobal, Product, ProductGlobal, Store
+from .chat import Message
+from .orders import Order
+from .serializer import to_json_value
+from .users import User
+
+
+class Projection(tuple):
+    """Subclasses set `model`, the model column names in `fields` and, for
+    values that are not columns of the model, a name -> SQL expression
+    mapping from `expressions()`. Each subclass must declare __slots__ = ()."""
+    __slots__ = ()
+    model = None
+    fields = ()
+    names = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if '__slots__' not in cls.__dict__:
+            raise TypeError('%s must declare __slots__ = ()' % cls.__name__)
+        cls.names = tuple(cls.fields) + tuple(cls.expressions())
+        for index, name in enumerate(cls.names):
+            setattr(cls, name, property(itemgetter(index)))
+
+    def __new__(cls, *values):
+        return tuple.__new__(cls, values)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % item for item in zip(self.names, self)))
+
+    @classmethod
+    def expressions(cls):
+        return {}
+
+    @classmethod
+    def columns(cls):
+        columns = [getattr(cls.model, name) for name in cls.fields]
+        columns.extend(expr.label(name) for name, expr in cls.expressions().items())
+        return columns
+
+    @classmethod
+    def select(cls, *criteria):
+        stmt = select(*cls.columns())
+        return stmt.where(*criteria) if criteria else stmt
+
+    @classmethod
+    def from_result(cls, result):
+        new = tuple.__new__
+        return [new(cls, row) for row in result]
+
+    @classmethod
+    def load(cls, bind, *criteria, order_by=None, limit=None, offset=None):
+        """Rows matching `criteria`, from a Session or a Connection."""
+        stmt = cls.select(*criteria)
+        if order_by is not None:
+            stmt = stmt.order_by(*(order_by if isinstance(order_by, (list, tuple)) else (order_by,)))
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        if offset is not None:
+            stmt = stmt.offset(offset)
+        return cls.from_result(bind.execute(stmt))
+
+    def json(self):
+        return {name: to_json_value(value) for name, value in zip(self.names, self)}
+
+
+def main_image_url(file_model, owner_column, owner_key):
+    """Correlated subquery for the url of an owner's main file, falling back to its first file."""
+    return select(file_model.url) \
+        .where(owner_column == owner_key) \
+        .order_by(func.coalesce(file_model.main, 0).desc(), file_model.file_id) \
+        .limit(1) \
+        .scalar_subquery()
+
+
+class ProductCard(Projection):
+    __slots__ = ()
+    model = Product
+    fields = ('product_id', 'title', 'price', 'discount', 'stock', 'category_id', 'store_id', 'status')
+
+    @classmethod
+    def expressions(cls):
+        return {'main_image': main_image_url(File, File.product_id, Product.product_id)}
+
+
+class ProductGlobalCard(Projection):
+    __slots__ = ()
+    model = ProductGlobal
+    fields = ('product_global_id', 'product_id', 'product_asin', 'title', 'price', 'color', 'size', 'active')
+
+    @classmethod
+    def expressions(cls):
+        return {'main_image': main_image_url(FileGlobal, FileGlobal.product_global_id,
+                                             ProductGlobal.product_global_id)}
+
+
+class CategoryItem(Projection):
+    __slots__ = ()
+    model = Category
+    fields = ('category_id', 'name', 'parent_id', 'banner', 'in_menu', 'status')
+
+
+class StoreCard(Projection):
+    __slots__ = ()
+    model = Store
+    fields = ('store_id', 'user_id', 'name', 'logo', 'status')
+
+
+class UserCard(Projection):
+    __slots__ = ()
+    model = User
+    fields = ('user_id', 'name', 'last_name', 'photo', 'role_id', 'status')
+
+
+class OrderSummary(Projection):
+    __slots__ = ()
+    model = Order
+    fields = ('order_id', 'product_id', 'user_id', 'seller_id', 'quantity', 'total', 'status', 'created_since')
+
+
+class MessageItem(Projection):
+    __slots__ = ()
+    model = Message
+    fields = ('message_id', 'room_id', 'user_id', 'content', 'status', 'created_since')
@@ -0,0 +1,318 @@
+# coding: utf-8
+"""Co-view recommendations, precomputed into products_suggested.
+
+rebuild() runs offline:
+
+1. load_views() streams history_product_user (weight log1p(visitor_count))
+   and history_category_user (the last product seen in the category, at
+   CATEGORY_WEIGHT) into a sparse user x product matrix, kept as CSR and
+   CSC index arrays.
+2. item_neighbors() computes the cosine similarity between products'
+   viewer vectors, a block of products at a time in a process pool, and
+   keeps the `neighbors` most similar products of each.
+3. recommend() scores, for every user, the neighbors of what they viewed
+   and keeps the `top_k` best products not viewed yet; write_suggestions()
+   replaces the user's generated rows (score IS NOT NULL) with them.
+   Rows added by hand have no score and are left alone.
+4. prune_suggestions() deletes the generated rows this run did not write,
+   those of users with no views left or no candidate products.
+
+At request time suggested_products() is one read on
+ix_products_suggested_user_id_score:
+
+    recommendations.rebuild(engine, top_k=20, workers=4)
+    cards = recommendations.suggested_products(session, user_id, limit=12)
+
+    python -m kiero_models.recommendations DATABASE_URL --top-k 20 --workers 4
+
+Needs numpy; the block products use scipy.sparse when it is installed.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import create_engine, delete, func, select
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+from .catalog import HistoryCategoryUser, HistoryProductUser, Product, ProductSuggested
+from .projections import ProductCard
+from .upsert import assign_ids, connection_for
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+CATEGORY_WEIGHT = 0.5
+# heavy viewers add noise and quadratic work; only their most viewed products count
+MAX_ITEMS_PER_USER = 500
+# dense similarity cells per block (8 bytes each)
+BLOCK_CELLS = 4 * 1024 * 1024
+USER_CHUNK = 2000
+
+
+class ViewMatrix(object):
+    """users x items view weights; `users` and `items` map row/column indexes to ids."""
+
+    def __init__(self, users, items, rows, cols, weights):
+        self.users = users
+        self.items = items
+        self.shape = (len(users), len(items))
+        order = np.lexsort((cols, rows))
+        self.user_ptr = _pointers(rows, len(users))
+        self.user_items = cols[order]
+        self.user_weights = weights[order]
+        order = np.lexsort((rows, cols))
+        self.item_ptr = _pointers(cols, len(items))
+        self.item_users = rows[order]
+        self.item_weights = weights[order]
+        self.norms = np.sqrt(np.bincount(cols, weights=weights * weights, minlength=len(items)))
+
+    def __len__(self):
+        return len(self.user_items)
+
+    def arrays(self):
+        """What a worker needs to compute similarity blocks."""
+        return (self.shape, self.user_ptr, self.user_items, self.user_weights, self.item_ptr, self.item_users,
+                self.item_weights, self.norms)
+
+
+def _pointers(keys, size):
+    return np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=size))])
+
+
+def _stream(conn, stmt, chunk_size):
+    result = conn.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    try:
+        for rows in result.partitions(chunk_size):
+            yield np.array(rows, dtype='float64')
+    finally:
+        result.close()
+
+
+def load_views(bind, chunk_size=CHUNK_SIZE, max_items_per_user=MAX_ITEMS_PER_USER):
+    """Build the ViewMatrix from both history tables, reading `chunk_size` rows at a time."""
+    if np is None:
+        raise ImportError('recommendations need numpy (pip install kiero_data_models[recommendations])')
+    conn = connection_for(bind)
+    products = HistoryProductUser.__table__
+    categories = HistoryCategoryUser.__table__
+    chunks = []
+    for block in _stream(conn, select(products.c.user_id, products.c.product,
+                                      func.coalesce(products.c.visitor_count, 1)), chunk_size):
+        chunks.append(np.column_stack([block[:, 0], block[:, 1], np.log1p(np.maximum(block[:, 2], 1))]))
+    for block in _stream(conn, select(categories.c.user_id, categories.c.product_id)
+                         .where(categories.c.product_id.isnot(None)), chunk_size):
+        chunks.append(np.column_stack([block, np.full(len(block), CATEGORY_WEIGHT)]))
+    views = np.concatenate(chunks) if chunks else np.empty((0, 3))
+
+    users, rows = np.unique(views[:, 0].astype('int64'), return_inverse=True)
+    items, cols = np.unique(views[:, 1].astype('int64'), return_inverse=True)
+    # the same (user, product) from both tables is one view with the summed weight
+    keys, inverse = np.unique(rows.astype('int64') * len(items) + cols, return_inverse=True)
+    weights = np.bincount(inverse, weights=views[:, 2])
+    rows, cols = keys // len(items), keys % len(items)
+    if max_items_per_user:
+        order = np.lexsort((-weights, rows))
+        rank = _group_rank(rows[order])
+        keep = order[rank < max_items_per_user]
+        rows, cols, weights = rows[keep], cols[keep], weights[keep]
+    return ViewMatrix(users, items, rows, cols, weights)
+
+
+def _group_rank(sorted_keys):
+    """Position of each element within its run of equal keys."""
+    if not len(sorted_keys):
+        return np.zeros(0, dtype='int64')
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(sorted_keys)) + 1])
+    lengths = np.diff(np.concatenate([starts, [len(sorted_keys)]]))
+    return np.arange(len(sorted_keys)) - np.repeat(starts, lengths)
+
+
+_worker_arrays = None
+
+
+def _init_worker(arrays):
+    global _worker_arrays
+    _worker_arrays = arrays
+
+
+def _similarity_block(low, high, neighbors, arrays=None):
+    """(neighbor indexes, similarities) of items low..high-1, best first; -1 marks no neighbor."""
+    shape, user_ptr, user_items, user_weights, item_ptr, item_users, item_weights, norms = \
+        arrays or _worker_arrays
+    n_items = shape[1]
+    size = high - low
+    start, end = item_ptr[low], item_ptr[high]
+    block_items = np.repeat(np.arange(size), np.diff(item_ptr[low:high + 1]))
+    viewers, weights = item_users[start:end], item_weights[start:end]
+    if sparse is not None:
+        left = sparse.csr_matrix((weights, (block_items, viewers)), shape=(size, shape[0]))
+        right = sparse.csr_matrix((user_weights, user_items, user_ptr), shape=shape)
+        dense = (left @ right).toarray()
+    else:
+        # expand each (item, viewer) to all the items of that viewer and sum per (item, other item)
+        lengths = user_ptr[viewers + 1] - user_ptr[viewers]
+        entry = np.repeat(np.arange(len(viewers)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = user_ptr[viewers][entry] + offsets
+        dense = np.bincount(block_items[entry] * n_items + user_items[positions],
+                            weights=weights[entry] * user_weights[positions],
+                            minlength=size * n_items).reshape(size, n_items)
+    denominator = np.outer(norms[low:high], norms)
+    np.divide(dense, denominator, out=dense, where=denominator > 0)
+    dense[np.arange(size), np.arange(low, high)] = 0
+    k = min(neighbors, n_items)
+    top = np.argpartition(-dense, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(dense, top, axis=1)
+    order = np.argsort(-scores, axis=1)
+    top, scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(scores, order, axis=1)
+    top[scores <= 0] = -1
+    return low, top.astype('int32'), scores.astype('float32')
+
+
+def item_neighbors(matrix, neighbors=50, workers=None):
+    """(n_items x neighbors) arrays of the most similar items and their cosine similarity."""
+    n_items = matrix.shape[1]
+    top = np.full((n_items, neighbors), -1, dtype='int32')
+    scores = np.zeros((n_items, neighbors), dtype='float32')
+    if not n_items:
+        return top, scores
+    step = max(1, BLOCK_CELLS // n_items)
+    blocks = [(low, min(low + step, n_items)) for low in range(0, n_items, step)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(blocks) == 1:
+        results = (_similarity_block(low, high, neighbors, matrix.arrays()) for low, high in blocks)
+        _store_blocks(results, top, scores)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(matrix.arrays(),)) as pool:
+            _store_blocks(pool.map(_similarity_block, *zip(*[(low, high, neighbors) for low, high in blocks])),
+                          top, scores)
+    return top, scores
+
+
+def _store_blocks(results, top, scores):
+    for low, block_top, block_scores in results:
+        width = block_top.shape[1]
+        top[low:low + len(block_top), :width] = block_top
+        scores[low:low + len(block_top), :width] = block_scores
+
+
+def recommend(matrix, top, scores, top_k=20, user_chunk=USER_CHUNK):
+    """Yield (user_ids, product_ids, scores) arrays, up to `top_k` unseen products per user, best first."""
+    n_items = matrix.shape[1]
+    for first in range(0, matrix.shape[0], user_chunk):
+        last = min(first + user_chunk, matrix.shape[0])
+        start, end = matrix.user_ptr[first], matrix.user_ptr[last]
+        users = np.repeat(np.arange(first, last), np.diff(matrix.user_ptr[first:last + 1]))
+        items, weights = matrix.user_items[start:end], matrix.user_weights[start:end]
+        candidates = top[items]
+        valid = candidates >= 0
+        keys = (np.repeat(users, candidates.shape[1]).reshape(candidates.shape).astype('int64') * n_items
+                + candidates)[valid]
+        values = (scores[items] * weights[:, None])[valid]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=values)
+        unseen = ~np.isin(keys, users.astype('int64') * n_items + items)
+        keys, totals = keys[unseen], totals[unseen]
+        order = np.lexsort((-totals, keys // n_items))
+        keys, totals = keys[order], totals[order]
+        best = _group_rank(keys // n_items) < top_k
+        keys, totals = keys[best], totals[best]
+        if len(keys):
+            yield matrix.users[keys // n_items], matrix.items[keys % n_items], totals
+
+
+def write_suggestions(bind, user_ids, product_ids, scores):
+    """Replace the generated suggestions of the users in `user_ids`; returns the rows written."""
+    conn = connection_for(bind)
+    table = ProductSuggested.__table__
+    users = sorted(set(int(user_id) for user_id in user_ids))
+    conn.execute(delete(table).where(table.c.user_id.in_(users), table.c.score.isnot(None)))
+    by_hand = set(tuple(row) for row in conn.execute(select(table.c.user_id, table.c.product_id)
+                                                     .where(table.c.user_id.in_(users))))
+    now = datetime.datetime.utcnow()
+    rows = [dict(user_id=int(user_id), product_id=int(product_id), score=float(score), created_since=now,
+                 updated_since=now)
+            for user_id, product_id, score in zip(user_ids, product_ids, scores)
+            if (int(user_id), int(product_id)) not in by_hand]
+    if rows:
+        if conn.dialect.name == 'sqlite':
+            assign_ids(conn, table.c.product_suggested_id, rows)
+        conn.execute(table.insert(), rows)
+    return len(rows)
+
+
+def prune_suggestions(bind, before):
+    """Delete the generated suggestions last written before `before`; returns the rows deleted."""
+    conn = connection_for(bind)
+    table = ProductSuggested.__table__
+    return conn.execute(delete(table).where(table.c.score.isnot(None),
+                                            func.coalesce(table.c.updated_since, table.c.created_since) < before)) \
+        .rowcount
+
+
+def rebuild(engine, top_k=20, neighbors=50, workers=None, chunk_size=CHUNK_SIZE):
+    """Recompute every user's suggestions; one transaction per chunk of users. Returns timing stats."""
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        matrix = load_views(conn, chunk_size=chunk_size)
+    loaded = time.perf_counter()
+    logger.info('loaded %d views of %d users on %d products in %.1f s',
+                len(matrix), matrix.shape[0], matrix.shape[1], loaded - started)
+    top, scores = item_neighbors(matrix, neighbors=neighbors, workers=workers)
+    similar = time.perf_counter()
+    logger.info('computed %d neighbors per product in %.1f s', neighbors, similar - loaded)
+    written = 0
+    # every row written below is stamped at or after this; older generated rows are left over
+    run_started = datetime.datetime.utcnow()
+    for user_ids, product_ids, user_scores in recommend(matrix, top, scores, top_k=top_k):
+        with engine.begin() as conn:
+            written += write_suggestions(conn, user_ids, product_ids, user_scores)
+    with engine.begin() as conn:
+        pruned = prune_suggestions(conn, run_started)
+    finished = time.perf_counter()
+    logger.info('wrote %d suggestions and pruned %d in %.1f s', written, pruned, finished - similar)
+    return {'users': matrix.shape[0], 'products': matrix.shape[1], 'views': len(matrix), 'written': written,
+            'pruned': pruned, 'load_s': loaded - started, 'similarity_s': similar - loaded,
+            'write_s': finished - similar}
+
+
+def suggested_products(bind, user_id, limit=20):
+    """ProductCards suggested to `user_id`: hand-picked first, then by score."""
+    stmt = ProductCard.select(ProductSuggested.user_id == user_id) \
+        .join(ProductSuggested, ProductSuggested.product_id == Product.product_id) \
+        .order_by(ProductSuggested.score.desc().nullsfirst()) \
+        .limit(limit)
+    return ProductCard.from_result(connection_for(bind).execute(stmt))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the co-view suggestions in products_suggested.')
+    parser.add_argument('url')
+    parser.add_argument('--top-k', type=int, default=20)
+    parser.add_argument('--neighbors', type=int, default=50)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    stats = rebuild(create_engine(args.url), top_k=args.top_k, neighbors=args.neighbors, workers=args.workers,
+                    chunk_size=args.chunk_size)
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
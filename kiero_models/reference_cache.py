@@ -0,0 +1,245 @@
+# coding: utf-8
+"""Process-local read-through cache for the small reference tables.
+
+Rows are kept as column snapshots with a TTL and LRU eviction. Once
+installed, many-to-one relationships pointing at a cached model
+(Order.method, User.role, Variant.dimension, ...) are filled from the cache
+when their parent row is loaded, so accessing them does not query. Writes
+to a cached model through the ORM drop its entries when they are flushed,
+and again when their transaction commits or rolls back, so nothing a
+concurrent reader cached from the old row or from the writer's uncommitted
+one outlives the transaction.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, lazyload, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.interfaces import MANYTOONE
+
+from .catalog import Banner, Dimension, ImageCategory, Variant
+from .orders import PaymentMethod
+from .users import DocumentType, Role
+
+REFERENCE_MODELS = (Role, DocumentType, PaymentMethod, Dimension, Variant, Banner, ImageCategory)
+_ALL = object()
+_PENDING = 'reference_cache_pending'
+
+
+class ReferenceCache(object):
+    def __init__(self, models=REFERENCE_MODELS, ttl=300, maxsize=4096):
+        self.models = tuple(models)
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {model: {'hits': 0, 'misses': 0} for model in self.models}
+        self._referrers = {}
+        self._eager = {}
+        self._installed = False
+
+    # -- lookups ---------------------------------------------------------
+
+    def get(self, session, model, *ident):
+        """Like session.get(model, ident), answered from the cache when possible."""
+        values = self._lookup((model, ident))
+        if values is not None:
+            return self._attach(session, model, ident, values)
+        obj = session.get(model, ident)
+        if obj is not None:
+            self._store(obj)
+        return obj
+
+    def all(self, session, model):
+        """Every row of `model`, cached as a whole."""
+        rows = self._lookup((model, _ALL))
+        if rows is None:
+            objs = session.query(model).all()
+            self._put((model, _ALL), [self._snapshot(obj) for obj in objs])
+            return objs
+        mapper = inspect(model)
+        keys = [mapper.get_property_by_column(col).key for col in mapper.primary_key]
+        return [self._attach(session, model, tuple(values[key] for key in keys), values) for values in rows]
+
+    def invalidate(self, model=None, *ident):
+        with self._lock:
+            if model is None:
+                self._entries.clear()
+                return
+            keys = [(model, ident), (model, _ALL)] if ident else \
+                [key for key in self._entries if key[0] is model]
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            sizes = {}
+            for model, _ in self._entries:
+                sizes[model] = sizes.get(model, 0) + 1
+            return {model.__name__: dict(counts, size=sizes.get(model, 0))
+                    for model, counts in self._stats.items()}
+
+    # -- wiring ----------------------------------------------------------
+
+    def install(self):
+        if self._installed:
+            return self
+        for mapper in inspect(self.models[0]).registry.mappers:
+            for rel in mapper.relationships:
+                if rel.direction is not MANYTOONE or rel.mapper.class_ not in self.models:
+                    continue
+                local_for = {remote: local for local, remote in rel.local_remote_pairs}
+                if set(local_for) != set(rel.mapper.primary_key):
+                    # not a lookup by primary key, nothing the cache can answer
+                    continue
+                keys = tuple(mapper.get_property_by_column(local_for[col]).key for col in rel.mapper.primary_key)
+                self._referrers.setdefault(mapper.class_, []).append((rel, keys))
+                if rel.lazy in ('joined', 'subquery', 'selectin', 'immediate'):
+                    self._eager.setdefault(mapper.class_, []).append(getattr(mapper.class_, rel.key))
+        for cls in self._referrers:
+            event.listen(cls, 'load', self._on_load)
+            event.listen(cls, 'refresh', self._on_refresh)
+        for model in self.models:
+            event.listen(model, 'load', self._on_reference_load)
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, name, self._on_write)
+        event.listen(Session, 'do_orm_execute', self._on_execute)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_soft_rollback', self._after_rollback)
+        self._installed = True
+        return self
+
+    def uninstall(self):
+        if not self._installed:
+            return
+        for cls in self._referrers:
+            event.remove(cls, 'load', self._on_load)
+            event.remove(cls, 'refresh', self._on_refresh)
+        for model in self.models:
+            event.remove(model, 'load', self._on_reference_load)
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.remove(model, name, self._on_write)
+        event.remove(Session, 'do_orm_execute', self._on_execute)
+        event.remove(Session, 'after_commit', self._after_commit)
+        event.remove(Session, 'after_soft_rollback', self._after_rollback)
+        self._referrers.clear()
+        self._eager.clear()
+        self._installed = False
+
+    def _on_execute(self, state):
+        # eager loaders would query regardless of the cache; fall back to lazy
+        # loading, which the load event below answers from the cache
+        if not state.is_select or not self._eager:
+            return
+        options = []
+        explicit = None
+        for desc in state.statement.column_descriptions:
+            entity = desc.get('entity')
+            if entity in self._eager and desc.get('expr') is entity:
+                if explicit is None:
+                    explicit = _loader_targets(state.statement)
+                options.extend(lazyload(attr) for attr in self._eager[entity]
+                               if (entity, attr.key) not in explicit)
+        if options:
+            state.statement = state.statement.options(*options)
+
+    def _on_load(self, target, context):
+        self._fill(context.session, target)
+
+    def _on_refresh(self, target, context, attrs):
+        self._fill(context.session, target)
+
+    def _on_reference_load(self, target, context):
+        self._store(target)
+
+    def _on_write(self, mapper, connection, target):
+        ident = tuple(mapper.primary_key_from_instance(target))
+        self.invalidate(mapper.class_, *ident)
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(_PENDING, set()).add((mapper.class_, ident))
+
+    def _after_commit(self, session):
+        for model, ident in session.info.pop(_PENDING, ()):
+            self.invalidate(model, *ident)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            for model, ident in session.info.pop(_PENDING, ()):
+                self.invalidate(model, *ident)
+
+    # -- internals -------------------------------------------------------
+
+    def _fill(self, session, target):
+        state = inspect(target)
+        for rel, keys in self._referrers.get(type(target), ()):
+            if rel.key in state.dict:
+                continue
+            ident = tuple(state.dict.get(key) for key in keys)
+            if None in ident:
+                continue
+            model = rel.mapper.class_
+            values = self._lookup((model, ident))
+            if values is not None:
+                set_committed_value(target, rel.key, self._attach(session, model, ident, values))
+
+    def _attach(self, session, model, ident, values):
+        key = session.identity_key(model, ident)
+        obj = session.identity_map.get(key)
+        if obj is None:
+            obj = model(**values)
+            make_transient_to_detached(obj)
+            session.add(obj)
+            self._fill(session, obj)
+        return obj
+
+    def _snapshot(self, obj):
+        state = inspect(obj)
+        return {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
+
+    def _store(self, obj):
+        model = type(obj)
+        if model not in self._stats:
+            return
+        mapper = inspect(model)
+        values = self._snapshot(obj)
+        if len(values) == len(mapper.column_attrs):
+            self._put((model, tuple(mapper.primary_key_from_instance(obj))), values)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            counts = self._stats.get(key[0])
+            if entry is None:
+                if counts is not None:
+                    counts['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            if counts is not None:
+                counts['hits'] += 1
+            return entry[1]
+
+    def _put(self, key, values):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def _loader_targets(statement):
+    """(class, relationship key) of every attribute a loader option of `statement` names."""
+    targets = set()
+    for option in getattr(statement, '_with_options', ()):
+        for element in getattr(option, 'context', ()):
+            path = element.path.path
+            # entities and attributes alternate; the option's own attribute is the last one
+            index = len(path) - 1 if len(path) % 2 == 0 else len(path) - 2
+            if index > 0:
+                targets.add((path[index - 1].class_, path[index].key))
+    return targets
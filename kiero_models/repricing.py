@@ -0,0 +1,162 @@
+# coding: utf-8
+"""Catalog repricing: products.price recomputed from products.usd in set-based UPDATEs.
+
+    price = usd * exchange_rate * (1 + earnings_percentage / 100) * (1 - discount / 100)
+
+rounded half up to the cent, or to a multiple of `round_to` (100 rounds to
+whole hundreds). A NULL earnings_percentage counts as `default_earnings`, a
+NULL discount as no discount; products without usd keep their price.
+Rows whose price would not change are not written; the others get
+updated_since = now, which also tells the product document cache.
+
+    repricing.reprice(session, 4100, Product.store_id == 3)      # one UPDATE per chunk of product ids
+    repricing.reprice_with(session, functools.partial(repricing.price_cents, exchange_rate=4100))
+
+reprice() runs its chunks in the caller's transaction. For a full catalog
+with a transaction per chunk and several workers, run the backfill job:
+
+    python -m kiero_models.backfill DATABASE_URL reprice exchange_rate=4100 round_to=100 --workers 8
+
+reprice_with() is for formulas that have to stay in Python: it reads the
+products in batches as NumPy arrays of cents, calls the function once per
+batch and writes back only the changed prices with one executemany.
+Postgres computes in exact numeric. SQLite computes in floating point like
+price_cents(), and like it drops the float noise before rounding half up to
+a whole number of cents, so amounts landing exactly on half a cent round up
+on both databases and in price_cents().
+"""
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import BigInteger, Numeric, bindparam, cast, func, literal, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .catalog import Product
+from .money import Money, as_money, as_numeric
+from .upsert import connection_for
+
+CHUNK_SIZE = 5000
+FIELDS = ('product_id', 'usd', 'price', 'earnings_percentage', 'discount')
+
+
+def _number(value):
+    return literal(Decimal(str(value)), Numeric(18, 6))
+
+
+class round_to_step(FunctionElement):
+    """round_to_step(amount, step): `amount` rounded half up to a multiple of `step`; amount >= 0."""
+    type = Numeric(18, 2)
+    name = 'round_to_step'
+    inherit_cache = True
+
+
+@compiles(round_to_step)
+def _round_to_step(element, compiler, **kw):
+    amount, step = [compiler.process(clause, **kw) for clause in element.clauses]
+    return 'round(%s / %s) * %s' % (amount, step, step)
+
+
+@compiles(round_to_step, 'sqlite')
+def _round_to_step_sqlite(element, compiler, **kw):
+    # floating point: as in price_cents(), drop the noise below 1e-6 steps, add half a step and
+    # truncate to whole steps, then to whole cents, so that the result is the double nearest the cents
+    amount, step = [compiler.process(clause, **kw) for clause in element.clauses]
+    return 'CAST(round(%s / %s, 6) + 0.5 AS INTEGER) * CAST(round(%s * 100) AS INTEGER) / 100.0' \
+        % (amount, step, step)
+
+
+def price_expression(exchange_rate, round_to=None, default_earnings=0):
+    """The repriced products.price as a SQL expression of the product's columns."""
+    table = Product.__table__
+    hundred = _number(100)
+    margin = 1 + func.coalesce(table.c.earnings_percentage, _number(default_earnings)) / hundred
+    kept = 1 - func.coalesce(table.c.discount, _number(0)) / hundred
+    amount = as_numeric(table.c.usd) * _number(exchange_rate) * margin * kept
+    return as_money(round_to_step(amount, _number(round_to if round_to is not None else '0.01')))
+
+
+def reprice_statement(exchange_rate, round_to=None, default_earnings=0):
+    """UPDATE products to their repriced price, skipping unchanged rows; add criteria with .where()."""
+    table = Product.__table__
+    price = price_expression(exchange_rate, round_to, default_earnings)
+    return update(table) \
+        .where(table.c.usd.isnot(None), table.c.price.is_distinct_from(price)) \
+        .values(price=price, updated_since=datetime.datetime.utcnow())
+
+
+def _chunks(conn, criteria, chunk_size):
+    key = Product.__table__.c.product_id
+    low, high = conn.execute(select(func.min(key), func.max(key)).where(*criteria)).one()
+    if low is None:
+        return []
+    return [(start, start + chunk_size - 1) for start in range(low, high + 1, chunk_size)]
+
+
+def reprice(bind, exchange_rate, *criteria, round_to=None, default_earnings=0, chunk_size=CHUNK_SIZE):
+    """Reprice the products matching `criteria`, chunk_size product ids per UPDATE; returns rows changed."""
+    conn = connection_for(bind)
+    key = Product.__table__.c.product_id
+    stmt = reprice_statement(exchange_rate, round_to, default_earnings).where(*criteria)
+    return sum(conn.execute(stmt.where(key.between(low, high))).rowcount
+               for low, high in _chunks(conn, criteria, chunk_size))
+
+
+def _cents(column):
+    return cast(func.round(as_numeric(column) * 100), BigInteger)
+
+
+def load_batch(conn, low, high, criteria=()):
+    """Products low..high (inclusive) with usd as a dict of NumPy arrays named after FIELDS.
+
+    usd and price are int64 cents; earnings_percentage and discount are
+    float64, NaN where NULL.
+    """
+    table = Product.__table__
+    rows = conn.execute(select(table.c.product_id, _cents(table.c.usd), _cents(table.c.price),
+                               table.c.earnings_percentage, table.c.discount)
+                        .where(table.c.product_id.between(low, high), table.c.usd.isnot(None), *criteria)
+                        .order_by(table.c.product_id)).all()
+    values = list(zip(*rows)) if rows else [()] * len(FIELDS)
+    return dict((name, np.array([np.nan if value is None else value for value in column],
+                                dtype='float64' if name in ('earnings_percentage', 'discount') else 'int64'))
+                for name, column in zip(FIELDS, values))
+
+
+def price_cents(columns, exchange_rate, round_to=None, default_earnings=0):
+    """The SQL formula of price_expression() over a batch from load_batch(); returns int64 cents."""
+    earnings = columns['earnings_percentage']
+    earnings = np.where(np.isnan(earnings), float(default_earnings), earnings)
+    discount = np.nan_to_num(columns['discount'])
+    amount = columns['usd'] / 100.0 * float(exchange_rate) * (1 + earnings / 100) * (1 - discount / 100)
+    step = float(round_to) if round_to is not None else 0.01
+    # drop the float noise first, so exact half cents round up as they do in numeric
+    return np.rint(np.floor(np.round(amount / step, 6) + 0.5) * step * 100).astype('int64')
+
+
+def reprice_with(bind, function, *criteria, chunk_size=CHUNK_SIZE):
+    """Reprice with function(columns) -> new price in cents per product of the batch; returns rows changed."""
+    if np is None:
+        raise ImportError('reprice_with() needs numpy (pip install kiero_data_models[analytics])')
+    conn = connection_for(bind)
+    table = Product.__table__
+    stmt = update(table).where(table.c.product_id == bindparam('_id')) \
+        .values(price=bindparam('_price', type_=Money(cents=True)), updated_since=bindparam('_now'))
+    changed = 0
+    for low, high in _chunks(conn, criteria, chunk_size):
+        columns = load_batch(conn, low, high, criteria)
+        if not len(columns['product_id']):
+            continue
+        prices = np.asarray(function(columns), dtype='int64')
+        mask = prices != columns['price']
+        if mask.any():
+            now = datetime.datetime.utcnow()
+            conn.execute(stmt, [{'_id': product_id, '_price': price, '_now': now} for product_id, price
+                                in zip(columns['product_id'][mask].tolist(), prices[mask].tolist())])
+            changed += int(mask.sum())
+    return changed
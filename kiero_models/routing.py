@@ -0,0 +1,187 @@
+# coding: utf-8
+"""Read/write routing between a primary database and read replicas.
+
+Sessions from a Router send plain SELECTs (queries, lazy loads, refreshes)
+to a replica and everything else (flushes, DML, SELECT ... FOR UPDATE, raw
+SQL) to the primary. Each session sticks to one replica, picked round-robin,
+so its reads stay consistent with each other. Once a session has written it
+reads from the primary too, until it is closed, so a unit of work always
+sees its own writes, also after commit():
+
+    router = Router.from_urls('postgresql://primary/kiero',
+                              ['postgresql://replica1/kiero', 'postgresql://replica2/kiero'])
+    Session = router.sessionmaker()
+    with Session() as session:
+        product = session.get(Product, 12)      # replica
+        product.stock -= 1
+        session.commit()                        # primary
+        product.json()                          # primary, from here on
+    router.stats()   # {'primary': 3, 'replica1': 1, 'replica2': 0}
+
+With Flask, declare the replicas as binds whose key starts with "replica"
+and db.session routes the same way; without such binds it behaves as before,
+with no statement counting either:
+
+    SQLALCHEMY_BINDS = {'replica1': 'postgresql://replica1/kiero'}
+
+Several copies of one SQLite file work as local stand-ins for replicas.
+"""
+import itertools
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+try:
+    from flask import current_app
+    from flask_sqlalchemy.session import Session as FlaskSession
+except ImportError:
+    current_app = FlaskSession = None
+
+REPLICA_PREFIX = 'replica'
+
+
+class Router(object):
+    """A primary engine, its replica engines and the statement count of each."""
+
+    def __init__(self, primary, replicas=(), names=None):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.names = list(names) if names else \
+            ['primary'] + ['%s%d' % (REPLICA_PREFIX, index) for index in range(1, len(self.replicas) + 1)]
+        self.counts = dict.fromkeys(self.names, 0)
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+        for name, engine in zip(self.names, self.engines()):
+            event.listen(engine, 'before_cursor_execute', self._counter(name))
+
+    @classmethod
+    def from_urls(cls, primary_url, replica_urls=(), **engine_options):
+        return cls(create_engine(primary_url, **engine_options),
+                   [create_engine(url, **engine_options) for url in replica_urls])
+
+    def engines(self):
+        return [self.primary] + self.replicas
+
+    def pick_replica(self):
+        """The next replica, round-robin; None without replicas."""
+        if not self.replicas:
+            return None
+        return self.replicas[next(self._next) % len(self.replicas)]
+
+    def sessionmaker(self, **kwargs):
+        return sessionmaker(class_=RoutingSession, router=self, **kwargs)
+
+    def stats(self):
+        """Statements executed per engine since creation or reset_stats()."""
+        with self._lock:
+            return dict(self.counts)
+
+    def reset_stats(self):
+        with self._lock:
+            self.counts = dict.fromkeys(self.names, 0)
+
+    def dispose(self):
+        for engine in self.engines():
+            engine.dispose()
+
+    def _counter(self, name):
+        def count(conn, cursor, statement, parameters, context, executemany):
+            with self._lock:
+                self.counts[name] += 1
+        return count
+
+
+def _is_read(clause):
+    return clause is not None and getattr(clause, 'is_select', False) \
+        and getattr(clause, '_for_update_arg', None) is None
+
+
+class _ReadRouting(object):
+    """get_bind() helpers shared by RoutingSession and FlaskRoutingSession."""
+    _sticky = False
+    _replica = None
+
+    def reads_from_replica(self, clause):
+        return not (self._sticky or self._flushing) and _is_read(clause)
+
+    def replica(self):
+        if self._replica is None:
+            self._replica = self.router.pick_replica()
+        return self._replica
+
+    def use_primary(self):
+        """Send every further statement of this session to the primary."""
+        self._sticky = True
+
+    def close(self):
+        super().close()
+        self._sticky = False
+        self._replica = None
+
+    def reset(self):
+        super().reset()
+        self._sticky = False
+        self._replica = None
+
+
+class RoutingSession(_ReadRouting, Session):
+    def __init__(self, router=None, **kwargs):
+        super().__init__(**kwargs)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+        if self.reads_from_replica(clause):
+            replica = self.replica()
+            if replica is not None:
+                return replica
+        return self.router.primary
+
+
+def flask_router(db):
+    """The Router for the current app of `db`: the default bind and the "replica*" binds.
+
+    None when the app declares no replica binds. Kept in app.extensions, so
+    it goes away with the app.
+    """
+    routers = current_app.extensions.setdefault('kiero_routers', {})
+    if db not in routers:
+        engines = db.engines
+        keys = sorted(key for key in engines if key and key.startswith(REPLICA_PREFIX))
+        routers[db] = Router(engines[None], [engines[key] for key in keys], ['primary'] + keys) if keys else None
+    return routers[db]
+
+
+if FlaskSession is not None:
+    class FlaskRoutingSession(_ReadRouting, FlaskSession):
+        @property
+        def router(self):
+            return flask_router(self._db)
+
+        def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+            if bind is None and self.reads_from_replica(clause) and self.router is not None:
+                replica = self.replica()
+                if replica is not None:
+                    return replica
+            return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+    _SESSION_CLASSES = (RoutingSession, FlaskRoutingSession)
+else:
+    FlaskRoutingSession = None
+    _SESSION_CLASSES = (RoutingSession,)
+
+
+def _stick_after_flush(session, flush_context):
+    session.use_primary()
+
+
+def _stick_on_write(state):
+    if not state.is_select:
+        state.session.use_primary()
+
+
+for _cls in _SESSION_CLASSES:
+    event.listen(_cls, 'after_flush', _stick_after_flush)
+    event.listen(_cls, 'do_orm_execute', _stick_on_write)
@@ -0,0 +1,163 @@
+# coding: utf-8
+"""Full-text search over Product and ProductGlobal.
+
+On Postgres each table gets a generated, weighted tsvector column with a GIN
+index; the column lives only in the database, so the models and json() are
+unchanged. On SQLite each table gets an FTS5 table keyed by the product id,
+kept in sync by ORM events once watch() is called. Either way results come
+back as projections, best match first:
+
+    search.install(engine)     # DDL, once; on SQLite also indexes the existing rows
+    search.watch()             # SQLite only: follow ORM inserts, updates and deletes
+    cards = search.search_products(session, 'zapatos cuero', category_id=12, status=1, limit=20)
+
+Query text is matched word by word (all words must appear); on Postgres it
+goes through websearch_to_tsquery, so quoted phrases and -exclusions work.
+"""
+import re
+
+from sqlalchemy import event, func, inspect, literal_column, select, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from .catalog import Product, ProductGlobal
+from .projections import ProductCard, ProductGlobalCard
+from .upsert import connection_for
+
+# text search configuration of the Postgres columns; titles mix Spanish and English
+PG_CONFIG = 'simple'
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchIndex(object):
+    """`columns` are (column name, Postgres weight, FTS5 bm25 weight), most relevant first."""
+
+    def __init__(self, model, projection, columns, vector='search_vector'):
+        self.model = model
+        self.projection = projection
+        self.columns = columns
+        self.table = model.__table__
+        self.key = self.table.primary_key.columns.values()[0].name
+        self.fts = self.table.name + '_fts'
+        self.vector = vector
+
+    def install(self, bind):
+        conn = connection_for(bind)
+        if conn.dialect.name == 'postgresql':
+            document = ' || '.join("setweight(to_tsvector('%s', coalesce(%s, '')), '%s')" % (PG_CONFIG, name, weight)
+                                   for name, weight, _ in self.columns)
+            conn.execute(text('ALTER TABLE %s ADD COLUMN IF NOT EXISTS %s tsvector GENERATED ALWAYS AS (%s) STORED'
+                              % (self.table.name, self.vector, document)))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_%s_%s ON %s USING gin (%s)'
+                              % (self.table.name, self.vector, self.table.name, self.vector)))
+        elif conn.dialect.name == 'sqlite':
+            conn.execute(text('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s)'
+                              % (self.fts, ', '.join(name for name, _, _ in self.columns))))
+            conn.execute(text("INSERT INTO %s(%s, rank) VALUES ('rank', 'bm25(%s)')"
+                              % (self.fts, self.fts, ', '.join(str(boost) for _, _, boost in self.columns))))
+            self.rebuild(conn)
+        else:
+            raise ValueError('full-text search needs Postgres or SQLite, not %s' % conn.dialect.name)
+
+    def rebuild(self, bind):
+        """Re-index every row (SQLite; the Postgres column is generated)."""
+        conn = connection_for(bind)
+        if conn.dialect.name != 'sqlite':
+            return
+        names = [name for name, _, _ in self.columns]
+        conn.execute(text('DELETE FROM %s' % self.fts))
+        conn.execute(text('INSERT INTO %s(rowid, %s) SELECT %s, %s FROM %s'
+                          % (self.fts, ', '.join(names), self.key, ', '.join(names), self.table.name)))
+
+    def search(self, bind, query, *criteria, limit=20, offset=0):
+        words = _WORD.findall(query or '')
+        if not words:
+            return []
+        conn = connection_for(bind)
+        key = self.table.c[self.key]
+        stmt = self.projection.select(*criteria)
+        if conn.dialect.name == 'postgresql':
+            vector = literal_column('%s.%s' % (self.table.name, self.vector), type_=TSVECTOR)
+            tsquery = func.websearch_to_tsquery(PG_CONFIG, query)
+            stmt = stmt.where(vector.op('@@')(tsquery)) \
+                .order_by(func.ts_rank_cd(vector, tsquery).desc(), key)
+        else:
+            fts = literal_column(self.fts)
+            match = ' '.join('"%s"' % word for word in words)
+            hits = select(literal_column('rowid').label('rowid'), literal_column('rank').label('rank')) \
+                .select_from(text(self.fts)) \
+                .where(fts.op('MATCH')(match)) \
+                .subquery()
+            stmt = stmt.join(hits, hits.c.rowid == key).order_by(hits.c.rank, key)
+        stmt = stmt.limit(limit).offset(offset)
+        return self.projection.from_result(conn.execute(stmt))
+
+    def watch(self):
+        event.listen(self.model, 'after_insert', self._on_save)
+        event.listen(self.model, 'after_update', self._on_save)
+        event.listen(self.model, 'after_delete', self._on_delete)
+
+    def unwatch(self):
+        event.remove(self.model, 'after_insert', self._on_save)
+        event.remove(self.model, 'after_update', self._on_save)
+        event.remove(self.model, 'after_delete', self._on_delete)
+
+    def _on_save(self, mapper, connection, target):
+        if connection.dialect.name != 'sqlite':
+            return
+        state = inspect(target)
+        names = [name for name, _, _ in self.columns]
+        if state.has_identity and not any(state.attrs[name].history.has_changes() for name in names):
+            return
+        ident = getattr(target, self.key)
+        connection.execute(text('DELETE FROM %s WHERE rowid = :ident' % self.fts), {'ident': ident})
+        values = dict((name, getattr(target, name)) for name in names)
+        values['ident'] = ident
+        connection.execute(text('INSERT INTO %s(rowid, %s) VALUES (:ident, %s)'
+                                % (self.fts, ', '.join(names), ', '.join(':' + name for name in names))), values)
+
+    def _on_delete(self, mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            connection.execute(text('DELETE FROM %s WHERE rowid = :ident' % self.fts),
+                               {'ident': getattr(target, self.key)})
+
+
+PRODUCTS = SearchIndex(Product, ProductCard, (('title', 'A', 10.0), ('brand', 'B', 5.0), ('description', 'C', 1.0)))
+PRODUCTS_GLOBAL = SearchIndex(ProductGlobal, ProductGlobalCard, (('title', 'A', 10.0), ('color', 'B', 2.0)))
+INDEXES = (PRODUCTS, PRODUCTS_GLOBAL)
+
+
+def install(bind):
+    for index in INDEXES:
+        index.install(bind)
+
+
+def watch():
+    for index in INDEXES:
+        index.watch()
+
+
+def unwatch():
+    for index in INDEXES:
+        index.unwatch()
+
+
+def search_products(bind, query, category_id=None, store_id=None, status=None, limit=20, offset=0):
+    """ProductCards matching `query`, best first."""
+    criteria = []
+    if category_id is not None:
+        criteria.append(Product.category_id == category_id)
+    if store_id is not None:
+        criteria.append(Product.store_id == store_id)
+    if status is not None:
+        criteria.append(Product.status == status)
+    return PRODUCTS.search(bind, query, *criteria, limit=limit, offset=offset)
+
+
+def search_products_global(bind, query, product_id=None, active=None, limit=20, offset=0):
+    """ProductGlobalCards matching `query`, best first."""
+    criteria = []
+    if product_id is not None:
+        criteria.append(ProductGlobal.product_id == product_id)
+    if active is not None:
+        criteria.append(ProductGlobal.active == active)
+    return PRODUCTS_GLOBAL.search(bind, query, *criteria, limit=limit, offset=offset)
@@ -0,0 +1,223 @@
+# coding: utf-8
+"""Compiled serializers behind DBUtils.json.
+
+Relationship arguments come in two forms:
+
+* plain names, e.g. json('images', 'category'): every name is expanded at
+  every level, as DBUtils.json always did;
+* dotted paths, e.g. json('images', 'user.addresses'): as soon as one
+  argument contains a dot, each argument is a path from the root object and
+  nothing outside those paths is expanded.
+
+Within one call a row is expanded at most once. With paths a row that was
+already expanded is emitted with its columns only; with plain names the same
+happens when a row re-enters itself through a cycle (which used to recurse
+until RecursionError).
+"""
+from sqlalchemy import inspect, tuple_
+from sqlalchemy.orm import Query, selectinload
+from sqlalchemy.orm.collections import InstrumentedList
+from sqlalchemy.sql import Select
+
+# (model class, spec) -> compiled serializer
+_serializers = {}
+# args tuple -> spec
+_specs = {}
+_MISSING = object()
+IN_CHUNK_SIZE = 500
+
+
+class PathSpec(tuple):
+    """Frozen tree of dotted relationship paths: ((key, PathSpec), ...)."""
+
+    def children(self):
+        return dict(self)
+
+
+def to_json_value(val):
+    return str(val) if not isinstance(val, int) and val is not None else val
+
+
+def parse_args(args):
+    spec = _specs.get(args)
+    if spec is None:
+        if any('.' in arg for arg in args):
+            tree = {}
+            for arg in args:
+                node = tree
+                for part in arg.split('.'):
+                    node = node.setdefault(part, {})
+            spec = _freeze(tree)
+        else:
+            spec = frozenset(args)
+        _specs[args] = spec
+    return spec
+
+
+def get_serializer(model, *args):
+    return _get(model, parse_args(args))
+
+
+def serialize(obj, *args):
+    return _get(type(obj), parse_args(args))(obj)
+
+
+def json_many(items, *args, session=None):
+    """Serialize a batch like [item.json(*args) for item in items].
+
+    `items` may be a list of instances, a Query or a select() (the latter
+    needs `session`). The requested relationships are loaded for the whole
+    batch with selectin loading, so the number of round trips does not grow
+    with the number of rows.
+    """
+    if isinstance(items, Query):
+        items = items.options(*loader_options(items.column_descriptions[0]['entity'], *args)).all()
+    elif isinstance(items, Select):
+        entity = items.column_descriptions[0]['entity']
+        items = session.scalars(items.options(*loader_options(entity, *args))).all()
+    else:
+        items = list(items)
+        if args:
+            preload(items, *args)
+    spec = parse_args(args)
+    return [_get(type(item), spec)(item) for item in items]
+
+
+def loader_options(model, *args):
+    return _loader_options(inspect(model), parse_args(args), None, ())
+
+
+def preload(items, *args):
+    """Load the relationships named in `args` for already loaded instances."""
+    by_model = {}
+    for item in items:
+        state = inspect(item)
+        if state.key is not None and state.session is not None:
+            by_model.setdefault((type(item), state.session), []).append(state.identity)
+    for (model, session), identities in by_model.items():
+        options = loader_options(model, *args)
+        if not options:
+            continue
+        pk = inspect(model).primary_key
+        for start in range(0, len(identities), IN_CHUNK_SIZE):
+            chunk = identities[start:start + IN_CHUNK_SIZE]
+            if len(pk) == 1:
+                criterion = pk[0].in_([ident[0] for ident in chunk])
+            else:
+                criterion = tuple_(*pk).in_(chunk)
+            session.query(model).filter(criterion).options(*options).all()
+
+
+def clear_cache():
+    _serializers.clear()
+    _specs.clear()
+
+
+def _freeze(tree):
+    return PathSpec(sorted((key, _freeze(sub)) for key, sub in tree.items()))
+
+
+def _expansions(mapper, spec):
+    if isinstance(spec, PathSpec):
+        children = spec.children()
+        return [(rel, children[rel.key]) for rel in mapper.relationships if rel.key in children]
+    return [(rel, spec) for rel in mapper.relationships if rel.key in spec]
+
+
+def _loader_options(mapper, spec, parent, seen):
+    options = []
+    for rel, child_spec in _expansions(mapper, spec):
+        if (mapper, rel.key) in seen:
+            continue
+        attr = getattr(mapper.class_, rel.key)
+        option = selectinload(attr) if parent is None else parent.selectinload(attr)
+        children = _loader_options(rel.mapper, child_spec, option, seen + ((mapper, rel.key),))
+        options.extend(children or [option])
+    return options
+
+
+def _get(model, spec):
+    fn = _serializers.get((model, spec))
+    if fn is None:
+        fn = _serializers[(model, spec)] = _compile(model, spec)
+    return fn
+
+
+def _compile(model, spec):
+    """Generate a function equivalent to DBUtils.json(*args) for `model`.
+
+    Column values are read straight from the instance dict when loaded and
+    only go through the instrumented attribute when expired or deferred.
+    The generated function takes the set of rows already expanded in the
+    current call as its second argument.
+    """
+    mapper = inspect(model)
+    column_names = [col.name for col in mapper.local_table.columns]
+    expansions = _expansions(mapper, spec)
+    namespace = {
+        '_MISSING': _MISSING,
+        'InstrumentedList': InstrumentedList,
+    }
+
+    lines = [
+        'def serialize(obj, seen=None):',
+        '    get = obj.__dict__.get',
+        '    out = {}',
+    ]
+    for name in column_names:
+        lines += [
+            '    v = get(%r, _MISSING)' % name,
+            '    if v is _MISSING:',
+            '        v = getattr(obj, %r)' % name,
+            '    out[%r] = str(v) if not isinstance(v, int) and v is not None else v' % name,
+        ]
+    if expansions:
+        lines += [
+            '    row = obj._sa_instance_state.key or id(obj)',
+            '    if seen is None:',
+            '        seen = set()',
+            '    elif row in seen:',
+            '        return out',
+            '    seen.add(row)',
+        ]
+    for i, (rel, child_spec) in enumerate(expansions):
+        key = rel.key
+        lookup = 'lookup%d' % i
+        namespace[lookup] = _make_lookup(child_spec)
+        lines += [
+            '    v = getattr(obj, %r)' % key,
+            '    if v is not None:',
+            '        if type(v) is InstrumentedList:',
+        ]
+        if key in column_names:
+            # keep the append-to-existing behaviour of the reflective version
+            lines += [
+                '            for sub in v:',
+                '                if %r not in out:' % key,
+                '                    out[%r] = []' % key,
+                '                out[%r].append(%s(type(sub))(sub, seen))' % (key, lookup),
+            ]
+        else:
+            lines += [
+                '            if v:',
+                '                out[%r] = [%s(type(sub))(sub, seen) for sub in v]' % (key, lookup),
+            ]
+        lines += [
+            '        else:',
+            '            out[%r] = %s(type(v))(v, seen)' % (key, lookup),
+            '    else:',
+            '        out[%r] = None' % key,
+        ]
+    if expansions and not isinstance(spec, PathSpec):
+        # plain names: only rows on the current branch count as a cycle
+        lines.append('    seen.discard(row)')
+    lines.append('    return out')
+
+    exec(compile('\n'.join(lines), '<serializer %s>' % model.__name__, 'exec'), namespace)
+    return namespace['serialize']
+
+
+def _make_lookup(spec):
+    def lookup(cls):
+        return _get(cls, spec)
+    return lookup
@@ -0,0 +1,47 @@
+# coding: utf-8
+"""Create the models' schema on SQLite, for tests and benchmarks.
+
+The Postgres schema does not create as-is on SQLite: MONEY has no SQLite
+rendering (Money columns already use NUMERIC(18, 2) there), BIGINT keys do
+not alias the rowid, and SQLite refuses autoincrement on composite primary
+keys. Importing this module registers SQLite-only renderings of MONEY and
+BIGINT; create_all() builds the tables
+from a copy of the metadata with the composite-key autoincrement dropped.
+The mapped tables are unchanged, so the models work against the result.
+"""
+from sqlalchemy import BigInteger, MetaData
+from sqlalchemy.dialects.postgresql.base import MONEY
+from sqlalchemy.ext.compiler import compiles
+
+from .kiero_models import Base
+
+
+@compiles(MONEY, 'sqlite')
+def _money_sqlite(type_, compiler, **kw):
+    return 'NUMERIC(18, 2)'
+
+
+@compiles(BigInteger, 'sqlite')
+def _bigint_sqlite(type_, compiler, **kw):
+    return 'INTEGER'
+
+
+def sqlite_metadata(metadata=None):
+    metadata = metadata if metadata is not None else Base.metadata
+    copy = MetaData()
+    for table in metadata.sorted_tables:
+        table.to_metadata(copy)
+    for table in copy.tables.values():
+        if len(table.primary_key.columns) > 1:
+            for col in table.primary_key.columns:
+                if col.autoincrement is True:
+                    col.autoincrement = 'auto'
+    return copy
+
+
+def create_all(engine, metadata=None):
+    sqlite_metadata(metadata).create_all(engine)
+
+
+def drop_all(engine, metadata=None):
+    sqlite_metadata(metadata).drop_all(engine)
@@ -0,0 +1,139 @@
+# coding: utf-8
+"""INSERT ... ON CONFLICT helpers shared by the bulk writers.
+
+Postgres and SQLite (3.24+) get a native ON CONFLICT DO UPDATE; other
+backends fall back to SELECT existing keys, UPDATE those and INSERT the rest.
+"""
+import sqlite3
+
+from sqlalchemy import bindparam, func, insert, select, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# keeps a multi-row VALUES statement under the bind parameter limits
+MAX_PARAMS = 30000
+
+
+def connection_for(bind):
+    if isinstance(bind, Session):
+        return bind.connection()
+    if isinstance(bind, Engine):
+        raise TypeError('pass a Connection or Session, not an Engine')
+    return bind
+
+
+def supports_on_conflict(conn):
+    name = conn.dialect.name
+    if name == 'postgresql':
+        return True
+    if name == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 24)
+    return False
+
+
+def supports_returning(conn):
+    name = conn.dialect.name
+    if name == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return name == 'postgresql'
+
+
+def upsert(bind, table, rows, index_elements, update=None, returning=()):
+    """Insert `rows` (dicts) into `table`, updating rows that hit `index_elements`.
+
+    `update` is a callable taking `incoming(name)` (the value the row tried
+    to insert) and returning the column values to set on conflict; by
+    default every non-key column present in the rows is overwritten.
+    Returns the `returning` columns of every affected row. Rows repeating a
+    key are collapsed, the last one wins.
+    """
+    conn = connection_for(bind)
+    rows = list({tuple(row[name] for name in index_elements): row for row in rows}.values())
+    returned = []
+    for group in _group_by_keys(rows):
+        columns = len(group[0]) or 1
+        size = max(1, MAX_PARAMS // columns)
+        for start in range(0, len(group), size):
+            chunk = group[start:start + size]
+            if supports_on_conflict(conn) and (not returning or supports_returning(conn)):
+                returned += _native(conn, table, chunk, index_elements, update, returning)
+            else:
+                returned += _fallback(conn, table, chunk, index_elements, update, returning)
+    return returned
+
+
+def next_ids(bind, column, count):
+    """Reserve `count` ids above the current max of `column`.
+
+    For tables whose key SQLite cannot autoincrement (BIGINT or composite
+    primary keys).
+    """
+    conn = connection_for(bind)
+    start = conn.execute(select(func.coalesce(func.max(column), 0))).scalar() + 1
+    return range(start, start + count)
+
+
+def assign_ids(bind, column, rows):
+    """Fill `column` in rows lacking it; SQLite cannot autoincrement BIGINT or composite primary keys."""
+    missing = [row for row in rows if row.get(column.name) is None]
+    for row, ident in zip(missing, next_ids(bind, column, len(missing))):
+        row[column.name] = ident
+
+
+def _group_by_keys(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return list(groups.values())
+
+
+def _update_values(table, keys, index_elements, update, incoming):
+    if update is None:
+        return {name: incoming(name) for name in keys
+                if name not in index_elements and not table.c[name].primary_key}
+    return update(incoming)
+
+
+def _native(conn, table, rows, index_elements, update, returning):
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(table).values(rows)
+    values = _update_values(table, rows[0], index_elements, update, lambda name: stmt.excluded[name])
+    if values:
+        stmt = stmt.on_conflict_do_update(index_elements=list(index_elements), set_=values)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(index_elements))
+    if returning:
+        return conn.execute(stmt.returning(*[table.c[name] for name in returning])).all()
+    conn.execute(stmt)
+    return []
+
+
+def _fallback(conn, table, rows, index_elements, update, returning):
+    key_cols = [table.c[name] for name in index_elements]
+    keys = [tuple(row[name] for name in index_elements) for row in rows]
+    key_expr = key_cols[0] if len(key_cols) == 1 else tuple_(*key_cols)
+    key_values = [k[0] for k in keys] if len(key_cols) == 1 else keys
+    existing = {tuple(r) for r in conn.execute(select(*key_cols).where(key_expr.in_(key_values)))}
+
+    new_rows = [row for row, key in zip(rows, keys) if key not in existing]
+    old_rows = [row for row, key in zip(rows, keys) if key in existing]
+    if new_rows:
+        conn.execute(insert(table), new_rows)
+    if old_rows:
+        values = _update_values(table, rows[0], index_elements, update, lambda name: bindparam('_new_' + name))
+        if values:
+            stmt = table.update().values(values)
+            for name, col in zip(index_elements, key_cols):
+                stmt = stmt.where(col == bindparam('_key_' + name))
+            params = []
+            for row in old_rows:
+                param = {'_new_' + name: val for name, val in row.items()}
+                param.update({'_key_' + name: row[name] for name in index_elements})
+                params.append(param)
+            conn.execute(stmt, params)
+    if not returning:
+        return []
+    return conn.execute(select(*[table.c[name] for name in returning]).where(key_expr.in_(key_values))).all()
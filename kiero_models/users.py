@@ -0,0 +1,157 @@
+# coding: utf-8
+"""Users, roles and account records."""
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, SmallInteger, String, Text, Index
+from sqlalchemy.schema import FetchedValue
+from sqlalchemy.orm import relationship
+
+from .base import Base, DBUtils
+from .pagination import KeysetPaginated
+
+
+class Address(Base, DBUtils):
+    __tablename__ = 'addresses'
+
+    address_id = Column(BigInteger, primary_key=True, server_default=FetchedValue())
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    address = Column(String(100), nullable=False)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+    city = Column(String(16), nullable=False)
+    department = Column(String(32), nullable=False)
+    neighborhood = Column(String(32), nullable=False)
+    names = Column(String(64), nullable=False)
+    description = Column(String(64))
+    phone = Column(String(16))
+
+    user = relationship('User', primaryjoin='Address.user_id == User.user_id', backref='addresses')
+
+
+class AuditLog(Base, DBUtils, KeysetPaginated):
+    __tablename__ = 'audit_logs'
+    __table_args__ = (
+        Index('ix_audit_logs_createdsince_traza_id', 'createdsince', 'traza_id'),
+    )
+    __keyset__ = ('createdsince', 'traza_id')
+    __partition__ = 'createdsince'
+
+    traza_id = Column(BigInteger, primary_key=True, server_default=FetchedValue())
+    solicitude = Column(String(60), nullable=False)
+    action = Column(String(60), nullable=False)
+    name = Column(String(60))
+    user_id = Column(Integer)
+    createdsince = Column(DateTime, server_default=FetchedValue())
+    updatedsince = Column(DateTime)
+
+
+class Claim(Base, DBUtils):
+    __tablename__ = 'claims'
+
+    claim_id = Column(BigInteger, primary_key=True, server_default=FetchedValue())
+    user_id = Column(ForeignKey('users.user_id'), nullable=False, index=True)
+    content = Column(String(350), nullable=False)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+    user = relationship('User', primaryjoin='Claim.user_id == User.user_id', backref='claims')
+
+
+class DocumentType(Base, DBUtils):
+    __tablename__ = 'document_type'
+
+    type_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    name = Column(String(80), nullable=False)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+
+class Role(Base, DBUtils):
+    __tablename__ = 'role'
+
+    role_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    name = Column(String(60), nullable=False)
+    description = Column(String(400))
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+
+
+class User(Base, DBUtils):
+    __tablename__ = 'users'
+
+    user_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    role_id = Column(ForeignKey('role.role_id'), nullable=False, index=True)
+    name = Column(String(50))
+    second_name = Column(String(50))
+    last_name = Column(String(50))
+    second_last_name = Column(String(50))
+    email = Column(String(50), nullable=False)
+    username = Column(String(50))
+    password = Column(String(255), nullable=False)
+    photo = Column(String(80))
+    document_type = Column(ForeignKey('document_type.type_id'))
+    id_number = Column(String(20))
+    id_file = Column(String(80))
+    phone = Column(String(20))
+    alternative_phone = Column(String(20))
+    last_login = Column(DateTime)
+    register_type = Column(String(15), nullable=False)
+    status = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    created_since = Column(DateTime, server_default=FetchedValue())
+    updated_since = Column(DateTime)
+    register_token = Column(String(64))
+    recovery_token = Column(String(64))
+    type_kiero_leader = Column(SmallInteger, nullable=True)
+    is_active = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    date_of_birth = Column(DateTime)
+    sex = Column(String(1))
+    document = Column(String(64))
+
+    document_type1 = relationship('DocumentType', primaryjoin='User.document_type == DocumentType.type_id',
+                                  backref='users')
+    role = relationship('Role', primaryjoin='User.role_id == Role.role_id', backref='users')
+
+
+class Notifications(Base, DBUtils, KeysetPaginated):
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        Index('ix_notifications_user_id_created_since', 'user_id', 'created_since', 'notification_id'),
+    )
+    __keyset__ = ('created_since', 'notification_id')
+    __partition__ = 'created_since'
+
+    notification_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    user_id = Column(Integer, primary_key=True, server_default=FetchedValue())
+    type = Column(SmallInteger, nullable=False, server_default=FetchedValue())
+    title = Column(String(64))
+    text = Column(String(255))
+    readed = Column(DateTime, server_default=FetchedValue())
+    order_id = Column(Integer)
+    link = Column(String(255))
+    image = Column(String(255))
+    created_since = Column(DateTime, server_default=FetchedValue())
+
+
+class ContactMails(Base, DBUtils):
+    __tablename__ = 'contacts_mails'
+
+    email_id = Column(Integer, primary_key=True, unique=True, server_default=FetchedValue())
+    email = Column(String(50))
+    created_since = Column(DateTime, server_default=FetchedValue())
+
+
+class AnulateUser(Base, DBUtils):
+    __tablename__ = 'anulate_user'
+
+    anulate_user_id = Column(Integer, primary_key=True, unique=True, server_default=FetchedValue())
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True, index=True)
+    movites = Column(Text, nullable=True)
+    recommendations = Column(Text, nullable=True)
+    created_since = Column(DateTime, server_default=FetchedValue())
+    update_since = Column(DateTime, server_default=FetchedValue())
+
+    user = relationship('User', primaryjoin='AnulateUser.user_id == User.user_id', backref='anulate_user')
@@ -0,0 +1,236 @@
+# coding: utf-8
+"""Write-behind view tracking for history_product_user and history_category_user.
+
+track() only bumps an in-memory counter keyed by (user, product) and
+(user, category). flush() writes every pending key in one transaction, as
+multi-row upserts adding to visitor_count, so a page view costs no write of
+its own. Once started, a background thread flushes every `interval` seconds
+or as soon as `max_pending` keys are buffered; stop(), also registered with
+atexit, drains the buffer.
+
+    tracker = ViewTracker(engine, interval=5, max_pending=5000)
+    tracker.start()
+    tracker.track(user.user_id, product.product_id, product.category_id)
+    tracker.stats()   # {'pending_keys': 12, 'last_flush_ms': 3.1, ...}
+
+A failed flush puts its counts back into the buffer for the next attempt;
+views are lost when the process dies between two flushes, or when flushes
+keep failing until more than `max_buffered` keys (10 * max_pending by
+default) are waiting: the least recently seen keys are then dropped with a
+warning and counted in stats()['dropped_views'].
+"""
+import atexit
+import datetime
+import logging
+import threading
+import time
+
+from sqlalchemy import delete, func, select, update
+
+from .catalog import HistoryCategoryUser, HistoryProductUser
+from .upsert import assign_ids, connection_for, upsert
+
+logger = logging.getLogger(__name__)
+
+
+class ViewTracker(object):
+    def __init__(self, engine, interval=5.0, max_pending=5000, max_buffered=None):
+        self.engine = engine
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_buffered = max_buffered if max_buffered is not None else max_pending * 10
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        # (user_id, product_id) -> [views, last seen]
+        self._products = {}
+        # (user_id, category_id) -> [views, last seen, last product_id]
+        self._categories = {}
+        self.views = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped_views = 0
+        self.rows_written = 0
+        self.last_flush = 0.0
+        self.max_flush = 0.0
+        self.total_flush = 0.0
+
+    def track(self, user_id, product_id, category_id=None):
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            entry = self._products.get((user_id, product_id))
+            if entry is None:
+                self._products[(user_id, product_id)] = [1, now]
+            else:
+                entry[0] += 1
+                entry[1] = now
+            if category_id is not None:
+                entry = self._categories.get((user_id, category_id))
+                if entry is None:
+                    self._categories[(user_id, category_id)] = [1, now, product_id]
+                else:
+                    entry[0] += 1
+                    entry[1] = now
+                    entry[2] = product_id
+            self.views += 1
+            full = len(self._products) + len(self._categories) >= self.max_pending
+        if full:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered views; returns the number of rows upserted."""
+        with self._flush_lock:
+            with self._lock:
+                products, self._products = self._products, {}
+                categories, self._categories = self._categories, {}
+            if not products and not categories:
+                return 0
+            started = time.perf_counter()
+            try:
+                with self.engine.begin() as conn:
+                    written = write_views(conn, products, categories)
+            except Exception:
+                self.failures += 1
+                logger.exception('view flush failed, keeping %d keys for the next one',
+                                 len(products) + len(categories))
+                self._restore(products, categories)
+                return 0
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.rows_written += written
+            self.last_flush = elapsed
+            self.max_flush = max(self.max_flush, elapsed)
+            self.total_flush += elapsed
+            return written
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='kiero-view-tracker', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=None):
+        """Stop the background thread and flush what is left."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping = True
+            self._wake.set()
+            thread.join(timeout)
+            self._thread = None
+            atexit.unregister(self.stop)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending_keys = len(self._products) + len(self._categories)
+            pending_views = sum(entry[0] for entry in self._products.values()) + \
+                sum(entry[0] for entry in self._categories.values())
+        return {
+            'pending_keys': pending_keys,
+            'pending_views': pending_views,
+            'views': self.views,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'dropped_views': self.dropped_views,
+            'rows_written': self.rows_written,
+            'views_per_flush': self.views / float(self.flushes) if self.flushes else 0.0,
+            'last_flush_ms': self.last_flush * 1000,
+            'max_flush_ms': self.max_flush * 1000,
+            'mean_flush_ms': self.total_flush / self.flushes * 1000 if self.flushes else 0.0,
+        }
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stopping:
+                self.flush()
+
+    def _restore(self, products, categories):
+        with self._lock:
+            for key, (views, seen) in products.items():
+                entry = self._products.setdefault(key, [0, seen])
+                entry[0] += views
+            for key, (views, seen, product_id) in categories.items():
+                entry = self._categories.setdefault(key, [0, seen, product_id])
+                entry[0] += views
+            overflow = len(self._products) + len(self._categories) - self.max_buffered
+            if overflow > 0:
+                self._drop_oldest(overflow)
+
+    def _drop_oldest(self, count):
+        keys = sorted([(entry[1], 0, key) for key, entry in self._products.items()] +
+                      [(entry[1], 1, key) for key, entry in self._categories.items()])[:count]
+        dropped = 0
+        for _, which, key in keys:
+            dropped += (self._categories if which else self._products).pop(key)[0]
+        self.dropped_views += dropped
+        logger.warning('view buffer over %d keys after failed flushes, dropped %d views of %d keys',
+                       self.max_buffered, dropped, count)
+
+
+def write_views(bind, products, categories):
+    """Upsert {(user_id, product_id): [views, seen]} and {(user_id, category_id): [views, seen, product_id]}.
+
+    Keys are written in sorted order so concurrent flushers lock rows in the
+    same order.
+    """
+    conn = connection_for(bind)
+    product_rows = [dict(user_id=user_id, product=product_id, visitor_count=views, created_since=seen,
+                         updated_since=seen)
+                    for (user_id, product_id), (views, seen) in sorted(products.items())]
+    category_rows = [dict(user_id=user_id, category=category_id, product_id=product_id, visitor_count=views,
+                          created_since=seen, updated_since=seen)
+                     for (user_id, category_id), (views, seen, product_id) in sorted(categories.items())]
+    if conn.dialect.name == 'sqlite':
+        assign_ids(conn, HistoryProductUser.__table__.c.history_product_user_id, product_rows)
+        assign_ids(conn, HistoryCategoryUser.__table__.c.history_category_user_id, category_rows)
+        assign_ids(conn, HistoryCategoryUser.__table__.c.product_feedback_id, category_rows)
+    if product_rows:
+        upsert(conn, HistoryProductUser.__table__, product_rows, ('user_id', 'product'),
+               update=_add_views(HistoryProductUser.__table__))
+    if category_rows:
+        upsert(conn, HistoryCategoryUser.__table__, category_rows, ('user_id', 'category'),
+               update=_add_views(HistoryCategoryUser.__table__))
+    return len(product_rows) + len(category_rows)
+
+
+def _add_views(table):
+    def values(incoming):
+        return {
+            'visitor_count': func.coalesce(table.c.visitor_count, 0) + incoming('visitor_count'),
+            'updated_since': incoming('updated_since'),
+        }
+    return values
+
+
+def merge_duplicate_history(bind):
+    """Collapse repeated (user, product) and (user, category) rows, summing visitor_count.
+
+    Run once before creating the unique constraints the upserts rely on.
+    Returns the number of rows removed.
+    """
+    conn = connection_for(bind)
+    removed = 0
+    for model, key, ident in ((HistoryProductUser, ('user_id', 'product'), 'history_product_user_id'),
+                              (HistoryCategoryUser, ('user_id', 'category'), 'history_category_user_id')):
+        table = model.__table__
+        key_columns = [table.c[name] for name in key]
+        duplicates = conn.execute(
+            select(*key_columns, func.min(table.c[ident]), func.sum(func.coalesce(table.c.visitor_count, 0)),
+                   func.max(table.c.updated_since))
+            .group_by(*key_columns)
+            .having(func.count() > 1)).all()
+        for row in duplicates:
+            same_key = [column == value for column, value in zip(key_columns, row[:len(key)])]
+            keep, views, seen = row[len(key):]
+            conn.execute(update(table).where(table.c[ident] == keep, *same_key)
+                         .values(visitor_count=views, updated_since=seen))
+            removed += conn.execute(delete(table).where(table.c[ident] != keep, *same_key)).rowcount
+    return removed
@@ -7,7 +7,12 @@ setup(name='kiero_data_models',
     url='https://github.com/jdiazvera/models_example',
     packages=['kiero_models'],
     install_requires=[
-        'sqlalchemy',
-        'flask_sqlalchemy'
-    ]
+        'sqlalchemy'
+    ],
+    extras_require={
+        'flask': ['flask_sqlalchemy'],
+        'async': ['sqlalchemy[asyncio]'],
+        'analytics': ['numpy'],
+        'recommendations': ['numpy', 'scipy'],
+    }
 )
\ No newline at end of file